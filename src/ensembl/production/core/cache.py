@@ -0,0 +1,123 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ['LRUCache']
+
+
+class LRUCache:
+    """Thread safe least recently used cache, bounded by the total size of its entries.
+    Each entry counts as 1 unless a getsizeof callable is supplied, e.g. len for strings.
+    Entries can be given a time to live, in seconds, after which they are dropped; entries set
+    with ttl=None are kept until evicted.
+
+    Any object providing the same get/set/evict methods can be used in place of this class
+    wherever a cache is pluggable.
+
+    Attributes:
+    maxsize   -- maximum total size of the entries
+    getsizeof -- callable returning the size of a value
+    ttl       -- default time to live of the entries
+    hits      -- number of lookups answered from the cache
+    misses    -- number of lookups which were not
+    """
+
+    def __init__(self, maxsize=1024, getsizeof=None, ttl=None):
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        """Return the value stored for key, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=...):
+        """Store value for key, evicting least recently used entries to make room.
+        ttl defaults to the cache ttl, values larger than the whole cache are not stored.
+        """
+        size = self.getsizeof(value) if self.getsizeof else 1
+        if ttl is ...:
+            ttl = self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._remove(key)
+            if size > self.maxsize:
+                return
+            while self._entries and self._size + size > self.maxsize:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = (value, size, expires)
+            self._size += size
+
+    def pop(self, key, default=None):
+        """Remove key from the cache and return its value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def evict(self, predicate):
+        """Remove all entries for which predicate(key, value) is true, return how many were removed"""
+        with self._lock:
+            keys = [key for key, (value, _size, _expires) in self._entries.items() if predicate(key, value)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        """Remove all entries, counters are kept"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return a dict of the cache counters and occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'entries': len(self._entries), 'size': self._size, 'maxsize': self.maxsize}
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
@@ -0,0 +1,175 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from ensembl.production.core.models.hive import Job, LogMessage, _chunked
+
+__all__ = ['HiveChangeFeed', 'JobTransition']
+
+logger = logging.getLogger(__name__)
+
+# A job status change seen by the feed, previous_status is None for jobs the feed had not seen before
+JobTransition = namedtuple('JobTransition',
+                           ['job_id', 'analysis', 'previous_status', 'status', 'when_completed'])
+
+_job = Job.__table__
+_log_message = LogMessage.__table__
+_job_select = select(_job.c.job_id, _job.c.analysis_id, _job.c.status, _job.c.when_completed)
+
+
+class HiveChangeFeed:
+    """Poll a hive database for the jobs whose status changed since the previous poll.
+    Rather than reading every job on each poll, the feed keeps three high-water marks:
+      - the highest job_id seen, to find new jobs
+      - the latest when_completed seen, to find jobs which reached DONE
+      - the highest log_message_id seen, to find jobs which logged something, e.g. a failure or a retry
+    Status changes which leave none of these traces (e.g. READY to RUN) are reported on the next one that
+    does.
+    Each transition is passed to the subscribed callbacks and, if a publisher is set, published as a dict
+    through the AMQPPublisher with the given routing_key.
+
+    Attributes:
+    hive        -- HiveInstance to watch
+    publisher   -- (optional) ensembl.production.core.amqp_publishing.AMQPPublisher re-publishing transitions
+    routing_key -- (optional) routing key for published messages, defaults to the publisher one
+    from_start  -- if on, the first poll reports every existing job, otherwise it only records the current
+                   state
+    """
+
+    def __init__(self, hive, publisher=None, routing_key=None, from_start=False):
+        self.hive = hive
+        self.publisher = publisher
+        self.routing_key = routing_key
+        self.from_start = from_start
+        self.max_job_id = 0
+        self.max_log_message_id = 0
+        self.last_completed = None
+        # jobs completed at last_completed, already reported
+        self._completed_at_mark = set()
+        self._statuses = {}
+        self._callbacks = []
+        self._primed = from_start
+
+    def subscribe(self, callback):
+        """Register callback to be called with each JobTransition"""
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        self._callbacks.remove(callback)
+
+    def poll(self):
+        """Return the JobTransition list since the previous poll, after notifying subscribers and publisher"""
+        with self.hive.Session() as session:
+            if not self._primed:
+                self._prime(session)
+                return []
+            transitions = []
+            transitions.extend(self._poll_new_jobs(session))
+            transitions.extend(self._poll_completed_jobs(session))
+            transitions.extend(self._poll_logged_jobs(session))
+            transitions = [self._make_transition(row, previous_status, session)
+                           for row, previous_status in transitions]
+        if transitions:
+            logger.debug("%s job transitions found", len(transitions))
+            self._notify(transitions)
+        return transitions
+
+    def run(self, interval=10, stop_event=None):
+        """Poll every interval seconds until stop_event (a threading.Event) is set"""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Error polling hive %s", self.hive.engine.url)
+            stop_event.wait(interval)
+
+    def _prime(self, session):
+        """Record the current state of the hive without reporting anything"""
+        for row in session.execute(select(_job.c.job_id, _job.c.status)):
+            self._statuses[row.job_id] = row.status
+        self.max_job_id = max(self._statuses, default=0)
+        self.max_log_message_id = \
+            session.execute(select(func.max(_log_message.c.log_message_id))).scalar() or 0
+        self.last_completed = session.execute(select(func.max(_job.c.when_completed))).scalar()
+        if self.last_completed is not None:
+            self._completed_at_mark = set(session.execute(
+                select(_job.c.job_id).where(_job.c.when_completed == self.last_completed)).scalars())
+        self._primed = True
+        logger.debug("Change feed primed at job %s, log message %s, completion %s",
+                     self.max_job_id, self.max_log_message_id, self.last_completed)
+
+    def _poll_new_jobs(self, session):
+        query = _job_select.where(_job.c.job_id > self.max_job_id).order_by(_job.c.job_id)
+        rows = session.execute(query).all()
+        if rows:
+            self.max_job_id = rows[-1].job_id
+        return self._changed(rows)
+
+    def _poll_completed_jobs(self, session):
+        query = _job_select.where(_job.c.when_completed.isnot(None), _job.c.job_id <= self.max_job_id)
+        if self.last_completed is not None:
+            query = query.where(_job.c.when_completed >= self.last_completed)
+        rows = [row for row in session.execute(query)
+                if not (row.when_completed == self.last_completed and row.job_id in self._completed_at_mark)]
+        if rows:
+            latest = max(row.when_completed for row in rows)
+            if latest != self.last_completed:
+                self.last_completed = latest
+                self._completed_at_mark = set()
+            self._completed_at_mark.update(row.job_id for row in rows if row.when_completed == latest)
+        return self._changed(rows)
+
+    def _poll_logged_jobs(self, session):
+        query = select(_log_message.c.job_id, func.max(_log_message.c.log_message_id)) \
+            .where(_log_message.c.log_message_id > self.max_log_message_id,
+                   _log_message.c.job_id.isnot(None)) \
+            .group_by(_log_message.c.job_id)
+        logged = dict(session.execute(query).all())
+        if not logged:
+            return []
+        self.max_log_message_id = max(logged.values())
+        rows = []
+        for chunk in _chunked(logged):
+            rows.extend(session.execute(_job_select.where(_job.c.job_id.in_(chunk))))
+        return self._changed(rows)
+
+    def _changed(self, rows):
+        """Record the status of rows, return (row, previous status) for those which changed"""
+        changed = []
+        for row in rows:
+            previous_status = self._statuses.get(row.job_id)
+            if previous_status != row.status:
+                self._statuses[row.job_id] = row.status
+                changed.append((row, previous_status))
+        return changed
+
+    def _make_transition(self, row, previous_status, session):
+        return JobTransition(row.job_id, self.hive._get_analysis_name(row.analysis_id, session),
+                             previous_status, row.status, row.when_completed)
+
+    def _notify(self, transitions):
+        for callback in self._callbacks:
+            for transition in transitions:
+                try:
+                    callback(transition)
+                except Exception:
+                    logger.exception("Error in change feed callback %s for %s", callback, transition)
+        if self.publisher is not None:
+            with self.publisher.acquire_producer() as producer:
+                for transition in transitions:
+                    producer.publish(transition._asdict(), self.routing_key)
@@ -0,0 +1,212 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import json
+import logging
+import sqlite3
+import threading
+
+from sqlalchemy import select
+
+from ensembl.production.core.models.hive import Job, _chunked
+from ensembl.production.core.perl_utils import perl_string_to_python
+
+__all__ = ['HiveJobIndex', 'INDEXED_KEYS']
+
+logger = logging.getLogger(__name__)
+
+# Job input keys indexed by default
+INDEXED_KEYS = ('dbname', 'species', 'tag', 'email', 'handover_token')
+
+_job = Job.__table__
+
+# Bumped whenever the index layout changes, to rebuild the indexes kept in files
+_INDEX_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS index_meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS job_input (job_id INTEGER NOT NULL, analysis_id INTEGER NOT NULL,
+                                      key TEXT NOT NULL, value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS job_input_key_value ON job_input (key, value);
+CREATE INDEX IF NOT EXISTS job_input_job_id ON job_input (job_id);
+CREATE TABLE IF NOT EXISTS indexed_job (job_id INTEGER PRIMARY KEY);
+"""
+
+
+class HiveJobIndex:
+    """Local SQLite index of selected keys of the hive jobs input, to find jobs without parsing every
+    input_id.
+    Each job input is parsed once: refresh() reads the jobs above the highest job_id already indexed, and the
+    ids of the last rescan_window jobs below it, to catch the jobs committed after others with higher ids.
+    List values are indexed element by element, nested dicts are not indexed.
+    Jobs deleted from the hive are dropped from the index the first time a lookup returns them.
+
+    The index can be kept in a file (path) to survive restarts, it is rebuilt if it was created for another
+    hive or with other keys.
+
+    Attributes:
+    hive   -- HiveInstance to index
+    keys   -- input keys to index, all the top level keys if None
+    path   -- SQLite database holding the index, in memory by default
+    rescan_window -- number of job ids below max_job_id checked again for jobs committed out of order
+    max_job_id -- highest job_id indexed
+    """
+
+    def __init__(self, hive, keys=INDEXED_KEYS, path=':memory:', batch_size=1000, rescan_window=1000):
+        self.hive = hive
+        self.keys = None if keys is None else frozenset(keys)
+        self.path = path
+        self.batch_size = batch_size
+        self.rescan_window = rescan_window
+        self.max_job_id = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._load_meta()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _signature(self):
+        return {'version': _INDEX_VERSION, 'hive': self.hive.engine.url.render_as_string(hide_password=True),
+                'keys': sorted(self.keys) if self.keys is not None else None}
+
+    def _load_meta(self):
+        meta = dict(self._db.execute("SELECT name, value FROM index_meta"))
+        signature = json.dumps(self._signature())
+        if meta.get('signature') == signature:
+            self.max_job_id = int(meta['max_job_id'])
+            return
+        if meta:
+            logger.info("Index %s was built for another hive or other keys, rebuilding it", self.path)
+        with self._db:
+            self._db.execute("DELETE FROM job_input")
+            self._db.execute("DELETE FROM indexed_job")
+            self._db.execute("DELETE FROM index_meta")
+            self._db.executemany("INSERT INTO index_meta (name, value) VALUES (?, ?)",
+                                 [('signature', signature), ('max_job_id', '0')])
+        self.max_job_id = 0
+
+    def refresh(self):
+        """Index the jobs created since the previous refresh, return how many were indexed"""
+        indexed = 0
+        with self._lock, self.hive.Session() as session:
+            # job ids are allocated before the jobs are committed, so recent ones may show up out of order
+            low = max(self.max_job_id - self.rescan_window, 0)
+            window_ids = session.execute(select(_job.c.job_id).where(_job.c.job_id > low)
+                                         .where(_job.c.job_id <= self.max_job_id)).scalars().all()
+            known_ids = {job_id for job_id, in
+                         self._db.execute("SELECT job_id FROM indexed_job WHERE job_id > ?", (low,))}
+            for chunk in _chunked(sorted(set(window_ids) - known_ids), self.batch_size):
+                query = select(_job.c.job_id, _job.c.analysis_id, _job.c.input_id) \
+                    .where(_job.c.job_id.in_(chunk))
+                indexed += self._index_jobs(session.execute(query).all(), session)
+            while True:
+                query = select(_job.c.job_id, _job.c.analysis_id, _job.c.input_id) \
+                    .where(_job.c.job_id > self.max_job_id).order_by(_job.c.job_id).limit(self.batch_size)
+                jobs = session.execute(query).all()
+                if not jobs:
+                    break
+                indexed += self._index_jobs(jobs, session)
+            with self._db:
+                # jobs below the window are never checked again
+                self._db.execute("DELETE FROM indexed_job WHERE job_id <= ?",
+                                 (max(self.max_job_id - self.rescan_window, 0),))
+        if indexed:
+            logger.debug("Indexed %s jobs, up to job %s", indexed, self.max_job_id)
+        return indexed
+
+    def _index_jobs(self, jobs, session):
+        """Index the input of the jobs, move max_job_id up to the highest of them, return their number"""
+        extended_data_ids = {self.hive._extended_data_id(job) for job in jobs} - {None}
+        extended_inputs = self.hive._get_analysis_data_inputs(extended_data_ids, session)
+        rows = []
+        for job in jobs:
+            extended_data_id = self.hive._extended_data_id(job)
+            try:
+                if extended_data_id is not None:
+                    job_input = extended_inputs[extended_data_id]
+                else:
+                    job_input = perl_string_to_python(job.input_id)
+            except (ValueError, KeyError):
+                logger.warning("Cannot parse input of job %s, not indexed", job.job_id)
+                continue
+            rows.extend((job.job_id, job.analysis_id, key, value) for key, value in self._entries(job_input))
+        max_job_id = max(self.max_job_id, max(job.job_id for job in jobs))
+        with self._db:
+            self._db.executemany("INSERT INTO job_input (job_id, analysis_id, key, value) "
+                                 "VALUES (?, ?, ?, ?)", rows)
+            self._db.executemany("INSERT OR IGNORE INTO indexed_job (job_id) VALUES (?)",
+                                 [(job.job_id,) for job in jobs])
+            self._db.execute("UPDATE index_meta SET value = ? WHERE name = 'max_job_id'", (str(max_job_id),))
+        self.max_job_id = max_job_id
+        return len(jobs)
+
+    def _entries(self, job_input):
+        """Yield the (key, value) pairs of a job input to index"""
+        if not isinstance(job_input, dict):
+            return
+        for key, value in job_input.items():
+            if self.keys is not None and key not in self.keys:
+                continue
+            for element in value if isinstance(value, list) else [value]:
+                if element is not None and not isinstance(element, (dict, list)):
+                    yield key, str(element)
+
+    def find_jobs(self, analysis=None, refresh=True, **criteria):
+        """List the ids of the jobs whose input matches all the criteria,
+        e.g. find_jobs(dbname='homo_sapiens_core')
+        A list criterion matches if any of its elements does, values are compared as strings.
+        analysis restricts the search to the jobs of an analysis (logic_name)
+        """
+        if not criteria:
+            raise ValueError("At least one criterion is needed")
+        unknown = set(criteria) - self.keys if self.keys is not None else set()
+        if unknown:
+            raise ValueError("Keys %s are not indexed" % ", ".join(sorted(unknown)))
+        if refresh:
+            self.refresh()
+        query = " INTERSECT ".join("SELECT job_id FROM job_input WHERE key = ? AND value = ?"
+                                   for _ in criteria)
+        params = [param for key, value in criteria.items() for param in (key, str(value))]
+        if analysis is not None:
+            analysis_id = self.hive.get_analysis_id(analysis)
+            if analysis_id is None:
+                raise ValueError("Analysis %s not found" % analysis)
+            query += " INTERSECT SELECT job_id FROM job_input WHERE analysis_id = ?"
+            params.append(analysis_id)
+        with self._lock:
+            job_ids = [job_id for job_id, in self._db.execute(query + " ORDER BY job_id", params)]
+        return self._existing(job_ids)
+
+    def _existing(self, job_ids):
+        """Drop the jobs deleted from the hive from the index, return the others"""
+        if not job_ids:
+            return job_ids
+        statuses = self.hive.get_jobs_status(job_ids)
+        deleted = [job_id for job_id in job_ids if job_id not in statuses]
+        if deleted:
+            self.forget(deleted)
+        return [job_id for job_id in job_ids if job_id in statuses]
+
+    def forget(self, job_ids):
+        """Remove jobs from the index"""
+        with self._lock, self._db:
+            for chunk in _chunked(job_ids, 500):
+                self._db.execute("DELETE FROM job_input WHERE job_id IN (%s)" % ", ".join("?" * len(chunk)),
+                                 chunk)
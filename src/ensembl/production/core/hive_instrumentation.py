@@ -0,0 +1,252 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+__all__ = ['HiveInstrumentation', 'QueryBudgetExceeded']
+
+logger = logging.getLogger(__name__)
+
+# Name under which statements issued outside any public HiveInstance method are counted
+UNATTRIBUTED = '<unattributed>'
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A HiveInstance method issued more statements than its budget allows"""
+
+
+class HiveInstrumentation:
+    """Opt-in count of the statements, rows and time spent in the database by each public HiveInstance method.
+    Statements are caught with the engine before/after_cursor_execute events and attributed to the outermost
+    public method running in the same thread, statements issued by other code (e.g. HiveChangeFeed) are
+    counted as <unattributed>.
+    Rows are the row count reported by the database driver: MySQL drivers report the rows fetched by a
+    SELECT, SQLite only reports the rows changed by INSERT/UPDATE/DELETE.
+
+    Usage:
+        instrumentation = HiveInstrumentation(hive)
+        hive.get_result_for_job_id(1)
+        instrumentation.snapshot()
+        {'get_result_for_job_id': {'calls': 1, 'statements': 5, 'max_statements': 5, 'rows': 0, ...}}
+
+    Attributes:
+    hive -- instrumented HiveInstance
+    """
+
+    def __init__(self, hive):
+        self.hive = hive
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._logger_stop = None
+        self._wrapped = []
+        self._install()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def _install(self):
+        event.listen(self.hive.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.hive.engine, 'after_cursor_execute', self._after_cursor_execute)
+        for name in dir(type(self.hive)):
+            if name.startswith('_') or name in vars(self.hive):
+                continue
+            if inspect.isfunction(inspect.getattr_static(type(self.hive), name)):
+                setattr(self.hive, name, self._wrap(name, getattr(self.hive, name)))
+                self._wrapped.append(name)
+
+    def uninstall(self):
+        """Stop counting, and logging, and restore the HiveInstance methods"""
+        self.stop_logging()
+        event.remove(self.hive.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.hive.engine, 'after_cursor_execute', self._after_cursor_execute)
+        for name in self._wrapped:
+            delattr(self.hive, name)
+        self._wrapped = []
+
+    def _calls(self):
+        """Stack of [method name, statements] of the public methods running in this thread"""
+        if not hasattr(self._local, 'calls'):
+            self._local.calls = []
+        return self._local.calls
+
+    def _wrap(self, name, method):
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def generator_wrapper(*args, **kwargs):
+                # statements are issued while the generator is consumed, so attribute each step
+                iterator = method(*args, **kwargs)
+                call = self._enter(name)
+                try:
+                    while True:
+                        self._push(call)
+                        start = time.perf_counter()
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            self._pop(call, time.perf_counter() - start)
+                        yield item
+                finally:
+                    iterator.close()
+                    self._exit(call)
+
+            return generator_wrapper
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            call = self._enter(name)
+            self._push(call)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._pop(call, time.perf_counter() - start)
+                self._exit(call)
+
+        return wrapper
+
+    def _enter(self, name):
+        """Return a new call record, or None if another public method is already running in this thread"""
+        if self._calls():
+            return None
+        return [name, 0]
+
+    def _push(self, call):
+        if call is not None:
+            self._calls().append(call)
+
+    def _pop(self, call, elapsed):
+        if call is None:
+            return
+        self._calls().pop()
+        with self._lock:
+            self._metric(call[0])['wall_time'] += elapsed
+
+    def _exit(self, call):
+        if call is None:
+            return
+        with self._lock:
+            metric = self._metric(call[0])
+            metric['calls'] += 1
+            metric['max_statements'] = max(metric['max_statements'], call[1])
+        budget = getattr(self._local, 'budgets', {}).get(call[0])
+        if budget is not None and call[1] > budget:
+            self._local.exceeded.append((call[0], call[1], budget))
+
+    def _metric(self, name):
+        if name not in self._metrics:
+            self._metrics[name] = {'calls': 0, 'statements': 0, 'max_statements': 0, 'rows': 0,
+                                   'db_time': 0.0, 'wall_time': 0.0}
+        return self._metrics[name]
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # kept on the execution context, which is dropped along with it when the statement fails
+        context._hive_instrumentation_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._hive_instrumentation_start
+        calls = self._calls()
+        if calls:
+            calls[-1][1] += 1
+            name = calls[-1][0]
+        else:
+            name = UNATTRIBUTED
+        with self._lock:
+            metric = self._metric(name)
+            metric['statements'] += 1
+            metric['rows'] += max(cursor.rowcount, 0)
+            metric['db_time'] += elapsed
+            if name == UNATTRIBUTED:
+                metric['calls'] += 1
+                metric['max_statements'] = 1
+
+    def snapshot(self, reset=False):
+        """Return a dict of the counters of each method which ran, sorted by decreasing statements
+        calls          -- number of calls
+        statements     -- number of statements executed
+        max_statements -- highest number of statements executed by a single call
+        rows           -- rows reported by the driver
+        db_time        -- seconds spent executing statements
+        wall_time      -- seconds spent in the method
+        """
+        with self._lock:
+            snapshot = {name: dict(metric) for name, metric in
+                        sorted(self._metrics.items(), key=lambda item: -item[1]['statements'])}
+            if reset:
+                self._metrics = {}
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+
+    def log(self, level=logging.INFO, reset=False):
+        """Log one line per method with its counters"""
+        for name, metric in self.snapshot(reset=reset).items():
+            logger.log(level, "%s: %s calls, %s statements (max %s per call), %s rows, %.3fs in db, "
+                       "%.3fs total", name, metric['calls'], metric['statements'], metric['max_statements'],
+                       metric['rows'], metric['db_time'], metric['wall_time'])
+
+    def start_logging(self, interval=60, level=logging.INFO, reset=True):
+        """Log the counters every interval seconds from a daemon thread, resetting them each time if reset"""
+        self.stop_logging()
+        stop_event = threading.Event()
+
+        def run():
+            while not stop_event.wait(interval):
+                self.log(level, reset=reset)
+
+        thread = threading.Thread(target=run, name='hive-instrumentation', daemon=True)
+        thread.start()
+        self._logger_stop = stop_event
+        return thread
+
+    def stop_logging(self):
+        if self._logger_stop is not None:
+            self._logger_stop.set()
+            self._logger_stop = None
+
+    @contextmanager
+    def query_budget(self, budgets=None, **method_budgets):
+        """Raise QueryBudgetExceeded when leaving the block if a call to one of the methods, in this thread,
+        executed more statements than its budget, e.g.
+            with instrumentation.query_budget(get_all_results=6):
+                hive.get_all_results('TestRunnable')
+        As a subclass of AssertionError, this fails a unittest test.
+        """
+        budgets = {**(budgets or {}), **method_budgets}
+        unknown = set(budgets) - set(self._wrapped)
+        if unknown:
+            raise ValueError("Methods %s are not instrumented" % ", ".join(sorted(unknown)))
+        self._local.budgets = budgets
+        self._local.exceeded = []
+        try:
+            yield
+        finally:
+            exceeded = self._local.exceeded
+            self._local.budgets = {}
+            self._local.exceeded = []
+        if exceeded:
+            raise QueryBudgetExceeded("; ".join(f"{name} executed {statements} statements, budget is {budget}"
+                                                for name, statements, budget in exceeded))
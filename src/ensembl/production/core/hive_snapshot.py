@@ -0,0 +1,519 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import array
+import bisect
+import calendar
+import datetime
+import json
+import logging
+import mmap
+import os
+import sys
+from collections import Counter
+
+from sqlalchemy import column, select, table
+
+from ensembl.production.core.models.hive import HiveInstance, _JobForest
+
+__all__ = ['HiveSnapshot', 'export_snapshot', 'JOB_STATUSES', 'MESSAGE_CLASSES']
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Status and message class codes, values met outside these lists are given the next codes
+JOB_STATUSES = ('SEMAPHORED', 'READY', 'CLAIMED', 'COMPILATION', 'PRE_CLEANUP', 'FETCH_INPUT', 'RUN',
+                'WRITE_OUTPUT', 'POST_HEALTHCHECK', 'POST_CLEANUP', 'DONE', 'FAILED', 'PASSED_ON', 'UNKNOWN',
+                'SPECIALIZATION')
+MESSAGE_CLASSES = ('INFO', 'PIPELINE_CAUTION', 'PIPELINE_ERROR', 'WORKER_CAUTION', 'WORKER_ERROR')
+
+# Value of NULL ids, times and runtimes in the columns
+NULL = -1
+
+# Columns exported from each table: (name, array typecode), 'str' columns are stored as offsets and UTF-8
+# data. status, message_class and the param_id_stack root are derived while exporting.
+COLUMNS = {
+    'job': (('job_id', 'q'), ('prev_job_id', 'q'), ('analysis_id', 'i'), ('status', 'b'),
+            ('retry_count', 'i'), ('runtime_msec', 'q'), ('when_completed', 'q'),
+            ('controlled_semaphore_id', 'q'), ('param_root', 'q')),
+    'log_message': (('log_message_id', 'q'), ('job_id', 'q'), ('when_logged', 'q'), ('status', 'b'),
+                    ('message_class', 'b'), ('msg', 'str')),
+    'analysis_base': (('analysis_id', 'i'), ('logic_name', 'str')),
+    'semaphore': (('semaphore_id', 'q'), ('dependent_job_id', 'q'), ('local_jobs_counter', 'i'),
+                  ('remote_jobs_counter', 'i')),
+    # job children, sorted by prev_job_id then job_id
+    'children': (('prev_job_id', 'q'), ('job_id', 'q')),
+    # count of the jobs controlled by each semaphore, by status
+    'semaphore_jobs': (('semaphore_id', 'q'), ('status', 'b'), ('count', 'q')),
+    # count of the jobs by param_id_stack root, analysis and status, as in get_all_jobs_progress
+    'progress': (('root_id', 'q'), ('analysis_id', 'i'), ('status', 'b'), ('count', 'q')),
+}
+
+# The hive tables, with the columns the ORM models do not map
+_tables = {
+    'job': table('job', column('job_id'), column('prev_job_id'), column('analysis_id'), column('status'),
+                 column('retry_count'), column('runtime_msec'), column('when_completed'),
+                 column('controlled_semaphore_id'), column('param_id_stack')),
+    'log_message': table('log_message', column('log_message_id'), column('job_id'), column('when_logged'),
+                         column('status'), column('message_class'), column('msg')),
+    'analysis_base': table('analysis_base', column('analysis_id'), column('logic_name')),
+    'semaphore': table('semaphore', column('semaphore_id'), column('dependent_job_id'),
+                       column('local_jobs_counter'), column('remote_jobs_counter')),
+}
+
+
+class _Codes:
+    """ Integer codes of a set of strings, growing as new strings are met """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.codes = {name: code for code, name in enumerate(self.names)}
+
+    def __call__(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+
+class _ColumnWriter:
+    """ Append only file of a column, written from array batches """
+
+    def __init__(self, path, typecode):
+        self.typecode = typecode
+        if typecode == 'str':
+            self.file = open(path + '.data', 'wb')
+            self.offsets = open(path + '.offsets', 'wb')
+            self.size = 0
+            array.array('q', [0]).tofile(self.offsets)
+        else:
+            self.file = open(path, 'wb')
+
+    def write(self, values):
+        if self.typecode != 'str':
+            array.array(self.typecode, values).tofile(self.file)
+            return
+        offsets = array.array('q')
+        for value in values:
+            data = (value or '').encode('utf-8')
+            self.file.write(data)
+            self.size += len(data)
+            offsets.append(self.size)
+        offsets.tofile(self.offsets)
+
+    def close(self):
+        self.file.close()
+        if self.typecode == 'str':
+            self.offsets.close()
+
+
+def _column_path(path, table_name, column_name):
+    return os.path.join(path, f'{table_name}.{column_name}')
+
+
+def _id(value):
+    return NULL if value is None else int(value)
+
+
+def _timestamp(value):
+    """ Seconds since the epoch of a hive TIMESTAMP, returned as a string by SQLite, a datetime by MySQL """
+    if value is None:
+        return NULL
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return calendar.timegm(value.timetuple())
+
+
+def _param_root(param_id_stack):
+    """ job_id the parameters were inherited from, see HiveInstance._get_all_jobs_progress """
+    root = param_id_stack.split(',', 1)[0] if param_id_stack and ',' in param_id_stack else ''
+    return int(root) if root.isdigit() else NULL
+
+
+def export_snapshot(hive, path, batch_size=10000):
+    """
+    Write a snapshot of the job, log_message, analysis_base and semaphore tables of a hive as column files
+    under the path directory, and return it as a HiveSnapshot.
+    Tables are read in batches of batch_size rows, by primary key, within a single transaction, so that
+    the snapshot is consistent on MySQL (InnoDB) and memory use does not grow with the size of the hive.
+    """
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, 'meta.json')
+    # meta.json is written last, a snapshot without one is incomplete
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    statuses = _Codes(JOB_STATUSES)
+    message_classes = _Codes(MESSAGE_CLASSES)
+    semaphore_jobs = Counter()
+    progress = Counter()
+
+    def job_row(row):
+        status = statuses(row.status)
+        semaphore_id = _id(row.controlled_semaphore_id)
+        root_id = _param_root(row.param_id_stack)
+        if semaphore_id != NULL:
+            semaphore_jobs[semaphore_id, status] += 1
+        if root_id != NULL:
+            progress[root_id, row.analysis_id, status] += 1
+        runtime = NULL if row.runtime_msec is None else int(round(row.runtime_msec))
+        return (row.job_id, _id(row.prev_job_id), row.analysis_id, status, row.retry_count or 0, runtime,
+                _timestamp(row.when_completed), semaphore_id, root_id)
+
+    row_converters = {
+        'job': job_row,
+        'log_message': lambda row: (row.log_message_id, _id(row.job_id), _timestamp(row.when_logged),
+                                    statuses(row.status), message_classes(row.message_class), row.msg),
+        'analysis_base': lambda row: (row.analysis_id, row.logic_name),
+        'semaphore': lambda row: (row.semaphore_id, _id(row.dependent_job_id), row.local_jobs_counter or 0,
+                                  row.remote_jobs_counter or 0),
+    }
+    counts = {}
+    with hive.Session() as session:
+        for table_name, convert in row_converters.items():
+            counts[table_name] = _export_table(session, path, table_name, convert, batch_size)
+    counts['children'] = _export_children(path, counts['job'])
+    counts['semaphore_jobs'] = _export_counts(path, 'semaphore_jobs', semaphore_jobs)
+    counts['progress'] = _export_counts(path, 'progress', progress)
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'hive': hive.engine.url.render_as_string(hide_password=True),
+        'exported_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'byteorder': sys.byteorder,
+        'statuses': statuses.names,
+        'message_classes': message_classes.names,
+        'tables': {table_name: {'rows': counts[table_name],
+                                'columns': {name: {'typecode': typecode,
+                                                   'itemsize': array.array(typecode).itemsize
+                                                   if typecode != 'str' else None}
+                                            for name, typecode in columns}}
+                   for table_name, columns in COLUMNS.items()},
+    }
+    with open(meta_path, 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+    logger.info("Exported %s jobs and %s log messages from %s to %s", counts['job'], counts['log_message'],
+                meta['hive'], path)
+    return HiveSnapshot(path)
+
+
+def _export_table(session, path, table_name, convert, batch_size):
+    """ Stream a table into its column files, batch_size rows at a time by primary key, return its rows """
+    hive_table = _tables[table_name]
+    columns = COLUMNS[table_name]
+    key = hive_table.c[columns[0][0]]
+    writers = [_ColumnWriter(_column_path(path, table_name, name), typecode) for name, typecode in columns]
+    rows = 0
+    last_key = None
+    try:
+        while True:
+            query = select(hive_table).order_by(key).limit(batch_size)
+            if last_key is not None:
+                query = query.where(key > last_key)
+            batch = [convert(row) for row in session.execute(query)]
+            if not batch:
+                break
+            for writer, values in zip(writers, zip(*batch)):
+                writer.write(values)
+            rows += len(batch)
+            last_key = batch[-1][0]
+            logger.debug("Exported %s rows of %s", rows, table_name)
+            if len(batch) < batch_size:
+                break
+    finally:
+        for writer in writers:
+            writer.close()
+    return rows
+
+
+def _export_children(path, job_count):
+    """ Write the (prev_job_id, job_id) pairs of the exported jobs, sorted for lookups by parent """
+    prev_job_ids = _read_column(_column_path(path, 'job', 'prev_job_id'), 'q', job_count)
+    job_ids = _read_column(_column_path(path, 'job', 'job_id'), 'q', job_count)
+    # jobs were exported by job_id, a stable sort keeps the children of each parent in order
+    order = sorted((row for row in range(job_count) if prev_job_ids[row] != NULL),
+                   key=prev_job_ids.__getitem__)
+    for name, values in (('prev_job_id', prev_job_ids), ('job_id', job_ids)):
+        writer = _ColumnWriter(_column_path(path, 'children', name), 'q')
+        writer.write(values[row] for row in order)
+        writer.close()
+    return len(order)
+
+
+def _export_counts(path, table_name, counts):
+    """ Write the keys and counts of a Counter, sorted by key """
+    rows = [key + (count,) for key, count in sorted(counts.items())]
+    columns = zip(*rows) if rows else [()] * len(COLUMNS[table_name])
+    for (name, typecode), values in zip(COLUMNS[table_name], columns):
+        writer = _ColumnWriter(_column_path(path, table_name, name), typecode)
+        writer.write(values)
+        writer.close()
+    return len(rows)
+
+
+def _read_column(column_path, typecode, length):
+    values = array.array(typecode)
+    with open(column_path, 'rb') as column_file:
+        values.fromfile(column_file, length)
+    return values
+
+
+class _Strings:
+    """ Sequence of the strings of a column, decoded on access """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+
+class HiveSnapshot:
+    """
+    Read only view of a snapshot written by export_snapshot, answering job tree and progress questions
+    without connecting to the hive.
+    Each column is a file of fixed size native integers, memory mapped on first use, so opening a snapshot of
+    millions of jobs is immediate and only the pages read are loaded. Statuses and message classes are stored
+    as int8 codes, indexes in the statuses and message_classes lists. NULL ids and times are -1, times are
+    seconds since the epoch. The column files can also be read with e.g. numpy.memmap(path, dtype='int64').
+
+    Usage:
+        snapshot = export_snapshot(hive, '/tmp/pipeline_snapshot')
+        snapshot.job_tree_status(1)
+        'complete'
+
+    Attributes:
+    path            -- directory holding the snapshot
+    meta            -- content of meta.json: source hive, export time, tables row counts and columns
+    statuses        -- status of each status code
+    message_classes -- log message class of each message_class code
+    analyses        -- {analysis_id: logic_name}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise ValueError(f"No complete hive snapshot in {path}")
+        with open(meta_path) as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported hive snapshot version {self.meta['version']} in {path}")
+        if self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"Hive snapshot {path} was written on a {self.meta['byteorder']} endian machine")
+        self.statuses = self.meta['statuses']
+        self.message_classes = self.meta['message_classes']
+        self._status_codes = {status: code for code, status in enumerate(self.statuses)}
+        self._maps = []
+        self._columns = {}
+        self._dependent_semaphores = None
+        self.analyses = dict(zip(self.column('analysis_base', 'analysis_id'),
+                                 self.column('analysis_base', 'logic_name')))
+
+    def close(self):
+        """ Release the memory mapped columns, no column returned by column() must be referenced anymore """
+        for values in self._columns.values():
+            if isinstance(values, memoryview):
+                values.release()
+            elif isinstance(values, _Strings):
+                values.offsets.release()
+                values.data.release()
+        self._columns = {}
+        for mapped, view in self._maps:
+            view.release()
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def rows(self, table_name):
+        return self.meta['tables'][table_name]['rows']
+
+    def column(self, table_name, column_name):
+        """ Sequence of the values of a column, ints or, for string columns, str """
+        key = (table_name, column_name)
+        if key not in self._columns:
+            typecode = self.meta['tables'][table_name]['columns'][column_name]['typecode']
+            column_path = _column_path(self.path, table_name, column_name)
+            if typecode == 'str':
+                self._columns[key] = _Strings(self._map(column_path + '.offsets', 'q'),
+                                              self._map(column_path + '.data', 'B'))
+            else:
+                self._columns[key] = self._map(column_path, typecode)
+        return self._columns[key]
+
+    def _map(self, column_path, typecode):
+        if os.path.getsize(column_path) == 0:
+            # empty files cannot be memory mapped
+            return memoryview(array.array(typecode))
+        with open(column_path, 'rb') as column_file:
+            mapped = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        self._maps.append((mapped, view))
+        return view.cast(typecode)
+
+    def _job_row(self, job_id):
+        job_ids = self.column('job', 'job_id')
+        row = bisect.bisect_left(job_ids, job_id)
+        if row == len(job_ids) or job_ids[row] != job_id:
+            return None
+        return row
+
+    def get_job(self, job_id):
+        """ Return the columns of a job as a dict, its status and analysis logic_name decoded, or None """
+        row = self._job_row(int(job_id))
+        if row is None:
+            return None
+        job = {name: self.column('job', name)[row] for name, _typecode in COLUMNS['job']}
+        job['status'] = self.statuses[job['status']]
+        job['logic_name'] = self.analyses.get(job['analysis_id'])
+        return job
+
+    def get_children(self, job_id):
+        """ Sorted job_ids of the children of a job """
+        prev_job_ids = self.column('children', 'prev_job_id')
+        start = bisect.bisect_left(prev_job_ids, job_id)
+        end = bisect.bisect_right(prev_job_ids, job_id, lo=start)
+        return list(self.column('children', 'job_id')[start:end])
+
+    def _dependent_semaphore(self, job_id):
+        """ (semaphore_id, local_jobs_counter) of the semaphore a job depends on, if any """
+        if self._dependent_semaphores is None:
+            self._dependent_semaphores = {
+                dependent_job_id: (semaphore_id, counter) for semaphore_id, dependent_job_id, counter in
+                zip(self.column('semaphore', 'semaphore_id'), self.column('semaphore', 'dependent_job_id'),
+                    self.column('semaphore', 'local_jobs_counter'))
+                if dependent_job_id != NULL}
+        return self._dependent_semaphores.get(job_id, (None, None))
+
+    def get_semaphore_status(self, semaphore_id):
+        """ 'complete', 'failed' or 'incomplete' from the status of the jobs controlled by a semaphore """
+        semaphore_ids = self.column('semaphore_jobs', 'semaphore_id')
+        start = bisect.bisect_left(semaphore_ids, semaphore_id)
+        end = bisect.bisect_right(semaphore_ids, semaphore_id, lo=start)
+        statuses = self.column('semaphore_jobs', 'status')
+        counts = self.column('semaphore_jobs', 'count')
+        return HiveInstance._semaphore_status({self.statuses[statuses[row]]: counts[row]
+                                               for row in range(start, end)})
+
+    def get_job_tree_status(self, job_id):
+        """ Status of the job tree rooted at job_id, as returned by HiveInstance.get_job_tree_status """
+        root = self.get_job(job_id)
+        if root is None:
+            raise ValueError("Job %s not found" % job_id)
+        forest = _JobForest()
+        forest.add(root['job_id'], None, root['status'], *self._dependent_semaphore(root['job_id']))
+        statuses = self.column('job', 'status')
+        # the walk visits the children of the root and of DONE jobs, and the children of every visited job are
+        # needed, since the semaphore of the first one is checked before the job status
+        stack = [root['job_id']]
+        while stack:
+            parent_id = stack.pop()
+            expand = parent_id == root['job_id'] or forest.statuses[parent_id] == 'DONE'
+            for child_id in self.get_children(parent_id):
+                status = self.statuses[statuses[self._job_row(child_id)]]
+                forest.add(child_id, parent_id, status, *self._dependent_semaphore(child_id))
+                if expand:
+                    stack.append(child_id)
+        semaphore_statuses = {semaphore_id: self.get_semaphore_status(semaphore_id)
+                              for semaphore_id in forest.pending_semaphores()}
+        return forest.fold(root['job_id'], root['status'], semaphore_statuses)
+
+    def get_all_jobs_progress(self, job_id, analysis_id=None, by_analysis=False):
+        """ Count the jobs inheriting the parameters of job_id, as HiveInstance.get_all_jobs_progress """
+        results = HiveInstance._new_progress()
+        if by_analysis:
+            results['analyses'] = {}
+        root_ids = self.column('progress', 'root_id')
+        analysis_ids = self.column('progress', 'analysis_id')
+        statuses = self.column('progress', 'status')
+        counts = self.column('progress', 'count')
+        start = bisect.bisect_left(root_ids, int(job_id))
+        end = bisect.bisect_right(root_ids, int(job_id), lo=start)
+        for row in range(start, end):
+            if analysis_id and analysis_ids[row] != int(analysis_id):
+                continue
+            status = self.statuses[statuses[row]]
+            HiveInstance._add_to_progress(results, status, counts[row])
+            if by_analysis:
+                logic_name = self.analyses.get(analysis_ids[row])
+                analysis_progress = results['analyses'].setdefault(logic_name, HiveInstance._new_progress())
+                HiveInstance._add_to_progress(analysis_progress, status, counts[row])
+        return results
+
+    def get_analysis_summary(self):
+        """
+        Count jobs and sum their runtime by analysis logic_name, in one pass over the job columns:
+        {logic_name: {'total': n, 'statuses': {status: n}, 'retries': n, 'runtime_msec': n,
+        'mean_runtime_msec': x, 'max_runtime_msec': n}}, runtimes only cover the jobs which recorded one
+        """
+        counts = Counter()
+        retries = Counter()
+        runtimes = Counter()
+        timed = Counter()
+        max_runtimes = {}
+        for analysis_id, status, retry_count, runtime in zip(
+                self.column('job', 'analysis_id'), self.column('job', 'status'),
+                self.column('job', 'retry_count'), self.column('job', 'runtime_msec')):
+            counts[analysis_id, status] += 1
+            retries[analysis_id] += retry_count
+            if runtime != NULL:
+                runtimes[analysis_id] += runtime
+                timed[analysis_id] += 1
+                max_runtimes[analysis_id] = max(max_runtimes.get(analysis_id, 0), runtime)
+        summary = {}
+        for (analysis_id, status), count in sorted(counts.items()):
+            logic_name = self.analyses.get(analysis_id)
+            if logic_name not in summary:
+                summary[logic_name] = {'total': 0, 'statuses': {}, 'retries': retries[analysis_id],
+                                       'runtime_msec': runtimes[analysis_id],
+                                       'mean_runtime_msec': runtimes[analysis_id] / timed[analysis_id]
+                                       if timed[analysis_id] else None,
+                                       'max_runtime_msec': max_runtimes.get(analysis_id)}
+            summary[logic_name]['total'] += count
+            summary[logic_name]['statuses'][self.statuses[status]] = count
+        return summary
+
+    def get_failure_messages(self, analysis=None):
+        """
+        Map the job_id of each FAILED job, of the given analysis logic_name if any, to its latest log message,
+        for the jobs which logged any. Messages can then be grouped to find the common causes of failures.
+        """
+        failed_code = self._status_codes.get('FAILED')
+        analysis_id = None
+        if analysis is not None:
+            analysis_id = next((key for key, logic_name in self.analyses.items() if logic_name == analysis),
+                               None)
+            if analysis_id is None:
+                raise ValueError("Analysis %s not found" % analysis)
+        failed_ids = {job_id for job_id, status, job_analysis_id in
+                      zip(self.column('job', 'job_id'), self.column('job', 'status'),
+                          self.column('job', 'analysis_id'))
+                      if status == failed_code and (analysis_id is None or job_analysis_id == analysis_id)}
+        last_rows = {}
+        # log messages were exported by log_message_id, the last row of each job is its latest message
+        for row, job_id in enumerate(self.column('log_message', 'job_id')):
+            if job_id in failed_ids:
+                last_rows[job_id] = row
+        messages = self.column('log_message', 'msg')
+        return {job_id: messages[row] for job_id, row in sorted(last_rows.items())}
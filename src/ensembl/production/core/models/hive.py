@@ -10,19 +10,29 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import copy
 import json
 import logging
 import re
+import threading
+from collections import defaultdict, namedtuple
+from itertools import islice
 
 import time
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, func, and_
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, func, or_, select, delete, \
+    literal, case, inspect, text, bindparam, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, joinedload
 
+from ensembl.production.core.cache import LRUCache
 from ensembl.production.core.perl_utils import dict_to_perl_string, perl_string_to_python
 
-__all__ = ['Result', 'LogMessage', 'Job', 'HiveInstance', 'Analysis']
+__all__ = ['Result', 'LogMessage', 'Job', 'JobStatus', 'IndexCheck', 'HiveInstance', 'HiveRegistry',
+           'Analysis']
 
 Base = declarative_base()
 
@@ -146,6 +156,7 @@ class Job(Base):
     input_id = Column(String)
     status = Column(String)
     param_id_stack = Column(String, default='')
+    accu_id_stack = Column(String, default='')
     prev_job_id = Column(Integer)
     controlled_semaphore_id = Column(Integer, ForeignKey("semaphore.semaphore_id"))
     role_id = Column(Integer, ForeignKey("role.role_id"))
@@ -166,30 +177,334 @@ class Job(Base):
             self.when_completed)
 
 
-Session = sessionmaker()
+# Read only view of the job columns needed to follow a job status, built from plain rows rather than ORM
+# objects so polling queries skip the eager joins and the identity map
+JobStatus = namedtuple('JobStatus', ['job_id', 'prev_job_id', 'analysis_id', 'status'])
+
+_job = Job.__table__
+_semaphore = Semaphore.__table__
+_job_status_select = select(_job.c.job_id, _job.c.prev_job_id, _job.c.analysis_id, _job.c.status)
+
+# Polling queries built once with bound parameters, rather than through session.query() on each call:
+# their SQL is compiled on first use, then found in the engine statement cache
+_job_by_id_stmt = select(Job).options(joinedload(Job.result)).where(Job.job_id == bindparam('job_id'))
+_job_status_by_id_stmt = _job_status_select.where(_job.c.job_id == bindparam('job_id'))
+_first_child_stmt = select(Job).where(Job.prev_job_id == bindparam('job_id')).order_by(Job.job_id).limit(1)
+_last_log_message_stmt = select(LogMessage).where(LogMessage.job_id == bindparam('job_id')).order_by(
+    LogMessage.log_message_id.desc()).limit(1)
+_semaphore_by_dependent_stmt = select(Semaphore).where(Semaphore.dependent_job_id == bindparam('job_id'))
+
+# Maximum number of values bound in a single IN (...) clause
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+# Total length, in characters, of the analysis_data inputs cached by each HiveInstance
+INPUT_CACHE_SIZE = 32 * 1024 * 1024
+
+# Length of the job.input_id column, CHAR(255)
+INPUT_ID_MAX_LENGTH = 255
+
+# Job input_id pointing to a row of analysis_data holding the actual input
+EXTENDED_DATA_RE = re.compile(r"^(_extended_data_id){1}(\s){1}(\d+){1}")
+
+# Columns HiveInstance filters on, with a predicate of the same shape as the one used, to EXPLAIN
+HOT_PATH_PREDICATES = (
+    (Job.__table__, 'prev_job_id', lambda column: column == 0),
+    (Job.__table__, 'param_id_stack', lambda column: column.like('0,%')),
+    (Job.__table__, 'controlled_semaphore_id', lambda column: column == 0),
+    (LogMessage.__table__, 'job_id', lambda column: column == 0),
+    (JobProgress.__table__, 'job_id', lambda column: column == 0),
+    (Semaphore.__table__, 'dependent_job_id', lambda column: column == 0),
+)
+
+# Outcome of HiveInstance.check_indexes for one column:
+# index is the name of an index starting with the column, None if there is none,
+# plan and rows are the access path and the estimated number of rows read according to EXPLAIN
+IndexCheck = namedtuple('IndexCheck', ['table', 'column', 'index', 'plan', 'rows', 'created'])
+
+# Tree status reported for a job, based on its own hive status, when no semaphore is pending
+JOB_TREE_STATUS = {
+    'FAILED': 'failed',
+    'READY': 'submitted',
+    'RUN': 'running',
+}
+
+# Job tree statuses which end a wait_for_jobs
+FINAL_TREE_STATUSES = ('complete', 'failed')
+
+
+def _chunked(iterable, size=IN_CLAUSE_CHUNK_SIZE):
+    """ Yield lists of at most size elements from iterable """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class _JobForest:
+    """
+    Job rows read for one or more job trees, on which the depth first walk of
+    HiveInstance._get_job_tree_status_recursive is replayed in memory
+    """
+
+    def __init__(self):
+        self.statuses = {}
+        self.children = defaultdict(set)
+        # (semaphore_id, local_jobs_counter) of the semaphore each job depends on
+        self.semaphores = {}
+
+    def add(self, job_id, prev_job_id, status, semaphore_id=None, local_jobs_counter=None):
+        self.statuses[job_id] = status
+        if prev_job_id is not None:
+            self.children[prev_job_id].add(job_id)
+        if semaphore_id is not None:
+            self.semaphores[job_id] = (semaphore_id, local_jobs_counter or 0)
+
+    def missing(self, job_ids):
+        return [job_id for job_id in job_ids if job_id not in self.statuses]
+
+    def pending_semaphores(self):
+        return {semaphore_id for semaphore_id, counter in self.semaphores.values() if counter > 0}
+
+    def fold(self, root_id, root_status, semaphore_statuses):
+        """
+        Return the status of the tree rooted at root_id, given the status of the root job
+        and the status of the pending semaphores
+        """
+        stack = [root_id]
+        while stack:
+            job_id = stack.pop()
+            child_ids = sorted(self.children[job_id])
+            if child_ids:
+                semaphore_id, counter = self.semaphores.get(child_ids[0], (None, 0))
+                if counter > 0:
+                    status = semaphore_statuses[semaphore_id]
+                    if status != 'complete':
+                        return status
+                    continue
+            status = root_status if job_id == root_id else self.statuses[job_id]
+            if status != 'DONE':
+                return JOB_TREE_STATUS.get(status, 'incomplete')
+            stack.extend(reversed(child_ids))
+        return 'complete'
+
+
+class _JobWaiter:
+    """
+    Background thread polling, for all the waiters of a HiveInstance, the tree status of the jobs waited for:
+    every job is read in the same batch of queries at each tick, whatever the number of waiters.
+    The interval between ticks grows by backoff, up to max_interval, while no status changes, and goes back
+    to min_interval on any change or new job to wait for. The thread stops once no job is waited for.
+    """
+
+    def __init__(self, hive, min_interval=1, max_interval=30, backoff=1.5):
+        self.hive = hive
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._futures = defaultdict(list)
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, job_ids):
+        """ Return a Future per job_id, resolved with the job tree status once final """
+        futures = {}
+        with self._lock:
+            for job_id in job_ids:
+                future = Future()
+                self._futures[int(job_id)].append(future)
+                futures[int(job_id)] = future
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'hive-waiter-{id(self.hive)}',
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return futures
+
+    def last_status(self, job_id):
+        """ Tree status of the job at the latest tick, None if it was not polled yet """
+        return self._statuses.get(int(job_id))
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self._lock:
+                # forget the jobs whose waiters all gave up
+                abandoned = [job_id for job_id, futures in self._futures.items()
+                             if all(future.done() for future in futures)]
+                for job_id in abandoned:
+                    del self._futures[job_id]
+                    self._statuses.pop(job_id, None)
+                if not self._futures:
+                    self._thread = None
+                    return
+                job_ids = list(self._futures)
+                self._wakeup.clear()
+            try:
+                changed = self._poll(job_ids)
+            except Exception:
+                logger.exception("Error polling the status of %s jobs", len(job_ids))
+                changed = False
+            interval = self.min_interval if changed else min(interval * self.backoff, self.max_interval)
+            if self._wakeup.wait(interval):
+                interval = self.min_interval
+
+    def _poll(self, job_ids):
+        """ Read the tree status of the jobs, resolve the futures of the ended ones, return if any changed """
+        with self.hive.Session() as session:
+            jobs = self.hive._get_jobs_status(job_ids, session)
+            tree_statuses = self.hive._get_job_tree_statuses(list(jobs.values()), session)
+        changed = False
+        with self._lock:
+            for job_id in job_ids:
+                if job_id not in jobs:
+                    status = None
+                else:
+                    status = tree_statuses[job_id]
+                changed = changed or status != self._statuses.get(job_id)
+                self._statuses[job_id] = status
+                if status is not None and status not in FINAL_TREE_STATUSES:
+                    continue
+                for future in self._futures.pop(job_id, []):
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    if status is None:
+                        future.set_exception(ValueError("Job %s not found" % job_id))
+                    else:
+                        future.set_result(status)
+                self._statuses.pop(job_id, None)
+        logger.debug("Polled %s jobs, changed: %s", len(job_ids), changed)
+        return changed
 
 
 class HiveInstance:
-    analysis_dict = {}
+    def __init__(self, url, timeout=3600, use_cte=True, result_cache=None, result_ttl=10,
+                 input_cache_size=INPUT_CACHE_SIZE, poll_interval=1, max_poll_interval=30, **engine_options):
+        """
+        Connect to the hive database at url, extra engine_options (e.g. pool_size) are passed to create_engine
+        Each instance has its own engine and sessions, so several hives can be queried side by side
+        If use_cte is on (default), job trees are walked with a single recursive query when the
+        backend supports it (MySQL >= 8.0, MariaDB >= 10.2, SQLite >= 3.8.3)
+        If a result_cache is supplied (e.g. an ensembl.production.core.cache.LRUCache), results from
+        get_result_for_job_id are cached: permanently once the job is DONE with its output, for result_ttl
+        seconds otherwise
+        Parsed analysis_data inputs are cached up to input_cache_size characters, 0 disables the cache
+        wait_for_jobs polls every poll_interval seconds, backing off to max_poll_interval while nothing
+        changes
+        """
+        self.url = url
+        self.engine = self._create_engine(url, timeout, **engine_options)
+        self.Session = sessionmaker(bind=self.engine)
+        self.use_cte = use_cte
+        self._cte_supported = None
+        self.result_cache = result_cache
+        self.result_ttl = result_ttl
+        # analysis_data rows are never updated, their parsed content is kept as compact JSON
+        self.input_cache = LRUCache(maxsize=input_cache_size, getsizeof=len) if input_cache_size else None
+        # analysis_base rows, loaded on first use and reloaded whenever a lookup misses
+        self._analysis_ids = {}
+        self._analysis_names = {}
+        self._analysis_lock = threading.Lock()
+        # last pipeline summary as (monotonic time, summary), shared by callers accepting a max_age
+        self._summary = None
+        self._summary_lock = threading.Lock()
+        self._waiter = _JobWaiter(self, poll_interval, max_poll_interval)
+        # counters of the compiled statement cache, updated from whichever thread runs the statement
+        self._statement_cache = {'hits': 0, 'misses': 0, 'uncached': 0}
+        self._statement_cache_lock = threading.Lock()
+        event.listen(self.engine, 'after_cursor_execute', self._count_statement_cache)
+
+    def _create_engine(self, url, timeout, **engine_options):
+        return create_engine(url, pool_recycle=timeout, **engine_options)
+
+    def _count_statement_cache(self, conn, cursor, statement, parameters, context, executemany):
+        if context is None:
+            return
+        if context.cache_hit is CACHE_HIT:
+            counter = 'hits'
+        elif context.cache_hit is CACHE_MISS:
+            counter = 'misses'
+        else:
+            counter = 'uncached'
+        with self._statement_cache_lock:
+            self._statement_cache[counter] += 1
 
-    def __init__(self, url, timeout=3600):
-        self.engine = create_engine(url, pool_recycle=timeout)
-        Session.configure(bind=self.engine)
+    def statement_cache_stats(self):
+        """
+        Return how many statements had their SQL found in the engine compiled statement cache (hits), had to
+        be compiled (misses), or could not be cached at all (uncached, e.g. raw SQL)
+        """
+        with self._statement_cache_lock:
+            stats = dict(self._statement_cache)
+        cacheable = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / cacheable if cacheable else 0.0
+        return stats
+
+    def _supports_recursive_cte(self, session):
+        """ Check, once per instance, whether the backend can run WITH RECURSIVE queries """
+        if not self.use_cte:
+            return False
+        if self._cte_supported is None:
+            # server_version_info is only set once a connection has been made
+            dialect = session.connection().dialect
+            version = dialect.server_version_info or ()
+            if dialect.name == 'sqlite':
+                self._cte_supported = version >= (3, 8, 3)
+            elif dialect.name == 'mysql':
+                self._cte_supported = version >= ((10, 2, 2) if dialect.is_mariadb else (8, 0, 1))
+            else:
+                self._cte_supported = True
+            logger.debug("Recursive CTE support for %s: %s", dialect.name, self._cte_supported)
+        return self._cte_supported
 
     def get_job_by_id(self, id):
         """ Retrieve a job given the unique surrogate ID """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_job_by_id(id, session)
 
     def _get_job_by_id(self, id, session):
-        job = session.query(Job).options(joinedload(Job.result)).filter(Job.job_id == id).first()
+        job = session.execute(_job_by_id_stmt, {'job_id': id}).scalars().first()
         if job is None:
             raise ValueError("Job %s not found" % id)
         return job
 
+    def get_job_status(self, id):
+        """ Retrieve the status of a job given its ID, without loading the job, its analysis or its result """
+        with self.Session() as session:
+            return self._get_job_status(id, session)
+
+    def _get_job_status(self, id, session):
+        row = session.execute(_job_status_by_id_stmt, {'job_id': id}).first()
+        if row is None:
+            raise ValueError("Job %s not found" % id)
+        return JobStatus._make(row)
+
+    def get_jobs_status(self, job_ids):
+        """ Map each of the given job ids to its JobStatus, missing jobs are left out """
+        with self.Session() as session:
+            return self._get_jobs_status(job_ids, session)
+
+    def _get_jobs_status(self, job_ids, session):
+        statuses = {}
+        for chunk in _chunked(job_ids):
+            for row in session.execute(_job_status_select.where(_job.c.job_id.in_(chunk))):
+                statuses[row.job_id] = JobStatus._make(row)
+        return statuses
+
+    def get_job_children_status(self, id):
+        """ List the JobStatus of the children of a job, by job_id """
+        with self.Session() as session:
+            return self._get_job_children_status(id, session)
+
+    def _get_job_children_status(self, id, session):
+        query = _job_status_select.where(_job.c.prev_job_id == id).order_by(_job.c.job_id)
+        return [JobStatus._make(row) for row in session.execute(query)]
+
     def get_worker_id(self, id):
         """ Retrieve a worker_id for a given role_id """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_worker_id(id, session)
 
     def _get_worker_id(self, id, session):
@@ -197,22 +512,42 @@ class HiveInstance:
 
     def get_jobs_failure_msg(self, id):
         """Get failures for all the parent and child jobs"""
-        with Session() as session:
+        with self.Session() as session:
             return self._get_jobs_failure_msg(id, session)
 
     def _get_jobs_failure_msg(self, id, session):
         failures = {}
-        parent_job = self.get_job_by_id(id)
-        if parent_job.status == 'FAILED':
-            failures[id] = self._get_job_failure_msg_by_id(id, session).msg
-        for child_job in session.query(Job).filter(Job.prev_job_id == id).all():
-            if child_job.status == 'FAILED':
-                failures[child_job.job_id] = self._get_job_failure_msg_by_id(child_job.job_id, session).msg
+        family = session.query(Job.job_id, Job.status).filter(
+            or_(Job.job_id == id, Job.prev_job_id == id)).order_by(Job.job_id).all()
+        if not any(job_id == int(id) for job_id, _status in family):
+            raise ValueError("Job %s not found" % id)
+        failed_ids = [job_id for job_id, status in family if status == 'FAILED']
+        messages = self._get_last_log_messages(failed_ids, session)
+        for job_id in failed_ids:
+            message = messages.get(job_id)
+            failures[id if job_id == int(id) else job_id] = message.msg if message is not None else None
         return failures
 
+    def get_last_log_messages(self, job_ids):
+        """ Map each of the given job ids to its latest log message, for the jobs which logged any """
+        with self.Session() as session:
+            return self._get_last_log_messages(job_ids, session)
+
+    def _get_last_log_messages(self, job_ids, session):
+        messages = {}
+        for chunk in _chunked(job_ids):
+            # a derived table of the latest message id of each job, joined on the primary key
+            last_messages = select(func.max(LogMessage.log_message_id).label('max_id')).where(
+                LogMessage.job_id.in_(chunk)).group_by(LogMessage.job_id).subquery()
+            query = session.query(LogMessage).join(last_messages,
+                                                   LogMessage.log_message_id == last_messages.c.max_id)
+            for message in query:
+                messages[message.job_id] = message
+        return messages
+
     def get_job_failure_msg_by_id(self, id, child=False):
         """ Retrieve a job failure message or job child if exist and if child flag turned on"""
-        with Session() as session:
+        with self.Session() as session:
             return self._get_job_failure_msg_by_id(id, session, child)
 
     def _get_job_failure_msg_by_id(self, id, session, child=False):
@@ -222,16 +557,15 @@ class HiveInstance:
         if child:
             child_job = self._get_job_child(job, session)
             if child_job is not None:
-                return session.query(LogMessage).filter(LogMessage.job_id == child_job.job_id).order_by(
-                    LogMessage.log_message_id.desc()).first()
-            return session.query(LogMessage).filter(LogMessage.job_id == id).order_by(
-                LogMessage.log_message_id.desc()).first()
-        return session.query(LogMessage).filter(LogMessage.job_id == id).order_by(
-            LogMessage.log_message_id.desc()).first()
+                return self._get_last_log_message(child_job.job_id, session)
+        return self._get_last_log_message(id, session)
+
+    def _get_last_log_message(self, job_id, session):
+        return session.execute(_last_log_message_stmt, {'job_id': job_id}).scalars().first()
 
     def get_worker_process_id(self, id):
         """ Find a workers process_id """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_worker_process_id(id, session)
 
     def _get_worker_process_id(self, id, session):
@@ -239,26 +573,63 @@ class HiveInstance:
 
     def get_analysis_by_name(self, name):
         """ Find an analysis """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_analysis_by_name(name, session)
 
     def _get_analysis_by_name(self, name, session):
-        return session.query(Analysis).filter(Analysis.logic_name == name).first()
+        analysis_id = self._get_analysis_id(name, session)
+        if analysis_id is None:
+            return None
+        return Analysis(analysis_id=analysis_id, logic_name=name)
+
+    @property
+    def analysis_dict(self):
+        """ Analysis ids by logic_name, as currently cached """
+        return dict(self._analysis_ids)
+
+    def get_analysis_id(self, name):
+        """ Find an analysis_id from its logic_name, None if there is no such analysis """
+        with self.Session() as session:
+            return self._get_analysis_id(name, session)
+
+    def _get_analysis_id(self, name, session):
+        if name not in self._analysis_ids:
+            self._load_analyses(session)
+        return self._analysis_ids.get(name)
+
+    def get_analysis_name(self, analysis_id):
+        """ Find an analysis logic_name from its analysis_id, None if there is no such analysis """
+        with self.Session() as session:
+            return self._get_analysis_name(analysis_id, session)
+
+    def _get_analysis_name(self, analysis_id, session):
+        if analysis_id not in self._analysis_names:
+            self._load_analyses(session)
+        return self._analysis_names.get(analysis_id)
+
+    def _load_analyses(self, session):
+        """ (Re)load the whole analysis_base name/id mapping in one query """
+        rows = session.query(Analysis.analysis_id, Analysis.logic_name).all()
+        # the lock only guards the swap, so that no query runs while it is held
+        with self._analysis_lock:
+            self._analysis_ids = {logic_name: analysis_id for analysis_id, logic_name in rows}
+            self._analysis_names = {analysis_id: logic_name for analysis_id, logic_name in rows}
+        logger.debug("Loaded %s analyses", len(rows))
 
     def create_job(self, analysis_name, input_data):
         """
         Create a job for the supplied analysis and input hash
         The input_data dict is converted to a Perl string before storing
         """
-        with Session() as session:
+        with self.Session() as session:
             return self._create_job(analysis_name, input_data, session)
 
     def _create_job(self, analysis_name, input_data, session):
         input_data['timestamp'] = time.ctime()
-        analysis = self._get_analysis_by_name(analysis_name, session)
-        if analysis is None:
+        analysis_id = self._get_analysis_id(analysis_name, session)
+        if analysis_id is None:
             raise ValueError("Analysis %s not found" % analysis_name)
-        job = Job(input_id=dict_to_perl_string(input_data), status='READY', analysis_id=analysis.analysis_id)
+        job = Job(input_id=dict_to_perl_string(input_data), status='READY', analysis_id=analysis_id)
         session.add(job)
         session.commit()
         # force load of object
@@ -267,26 +638,128 @@ class HiveInstance:
         job.result
         return job
 
+    def create_jobs(self, analysis_name, inputs, chunk_size=1000):
+        """
+        Create a job for each input dict of the supplied analysis, all in a single transaction
+        inputs can be any iterable (e.g. a generator), it is consumed and inserted chunk_size dicts at a time
+        Return the ids of the new jobs, in the order of inputs
+        """
+        with self.Session() as session:
+            return self._create_jobs(analysis_name, inputs, session, chunk_size)
+
+    def _create_jobs(self, analysis_name, inputs, session, chunk_size=1000):
+        analysis_id = self._get_analysis_id(analysis_name, session)
+        if analysis_id is None:
+            raise ValueError("Analysis %s not found" % analysis_name)
+        job_ids = []
+        for chunk in _chunked(inputs, chunk_size):
+            timestamp = time.ctime()
+            input_ids = [dict_to_perl_string({**input_data, 'timestamp': timestamp}) for input_data in chunk]
+            # the new ids are read back by input_id, which MySQL would silently truncate past the column
+            # length
+            too_long = [input_id for input_id in input_ids if len(input_id) > INPUT_ID_MAX_LENGTH]
+            if too_long:
+                raise ValueError("Job input longer than %s characters: %s"
+                                 % (INPUT_ID_MAX_LENGTH, too_long[0]))
+            session.execute(Job.__table__.insert(), [
+                {'input_id': input_id, 'status': 'READY', 'analysis_id': analysis_id, 'param_id_stack': '',
+                 'accu_id_stack': ''}
+                for input_id in input_ids
+            ])
+            # input_id, param_id_stack, accu_id_stack and analysis_id are unique together
+            created = dict(session.query(Job.input_id, Job.job_id).filter(
+                Job.analysis_id == analysis_id, Job.param_id_stack == '', Job.accu_id_stack == '',
+                Job.input_id.in_(input_ids)))
+            job_ids.extend(created[input_id] for input_id in input_ids)
+        session.commit()
+        logger.debug("Created %s jobs for analysis %s", len(job_ids), analysis_name)
+        return job_ids
+
     def get_analysis_data_input(self, analysis_data_id):
         """ Get the job input stored in the analysis_data table. Get input from child job if exist"""
-        with Session() as session:
+        with self.Session() as session:
             return self._get_analysis_data_input(analysis_data_id, session)
 
     def _get_analysis_data_input(self, analysis_data_id, session):
         return session.query(AnalysisData).filter(AnalysisData.analysis_data_id == analysis_data_id).first()
 
+    def get_analysis_data_inputs(self, analysis_data_ids):
+        """ Map each of the given analysis_data ids to its parsed input, missing ids are left out """
+        with self.Session() as session:
+            return self._get_analysis_data_inputs(analysis_data_ids, session)
+
+    def _get_analysis_data_inputs(self, analysis_data_ids, session):
+        inputs = {}
+        missing = set()
+        for analysis_data_id in {int(analysis_data_id) for analysis_data_id in analysis_data_ids}:
+            cached = self.input_cache.get(analysis_data_id) if self.input_cache is not None else None
+            if cached is not None:
+                # loading the compact JSON is much cheaper than parsing the Perl string again, or a deepcopy
+                inputs[analysis_data_id] = json.loads(cached)
+            else:
+                missing.add(analysis_data_id)
+        for chunk in _chunked(missing):
+            query = session.query(AnalysisData.analysis_data_id, AnalysisData.data).filter(
+                AnalysisData.analysis_data_id.in_(chunk))
+            for analysis_data_id, data in query:
+                try:
+                    inputs[analysis_data_id] = perl_string_to_python(data)
+                except ValueError as e:
+                    raise ValueError(f'Cannot parse analysis_data {analysis_data_id}') from e
+                if self.input_cache is not None:
+                    self.input_cache.set(analysis_data_id,
+                                         json.dumps(inputs[analysis_data_id], separators=(',', ':')))
+        return inputs
+
+    def input_cache_stats(self):
+        """ Return the analysis_data input cache counters, or None if inputs are not cached """
+        return self.input_cache.stats() if self.input_cache is not None else None
+
+    def _get_job_input(self, job, session):
+        """ Return the parsed input of a job, read from analysis_data if it does not fit in the job row """
+        extended_data_id = self._extended_data_id(job)
+        if extended_data_id is None:
+            return perl_string_to_python(job.input_id)
+        inputs = self._get_analysis_data_inputs([extended_data_id], session)
+        if extended_data_id not in inputs:
+            raise ValueError(f'analysis_data {extended_data_id} not found')
+        return inputs[extended_data_id]
+
     def get_semaphore_data(self, semaphore_job_id):
         """ Get the job semaphore count if exist"""
-        with Session() as session:
+        with self.Session() as session:
             return self._get_semaphore_data(semaphore_job_id, session)
 
     def _get_semaphore_data(self, semaphore_job_id, session):
-        return session.query(Semaphore).filter(Semaphore.dependent_job_id == semaphore_job_id).first()
+        return session.execute(_semaphore_by_dependent_stmt, {'job_id': semaphore_job_id}).scalars().first()
 
     def get_result_for_job_id(self, id, child=False, progress=True, analysis_id=None):
         """ Get result for a given job id. If child flag is turned on and job child exist, get result for child job"""
-        with Session() as session:
-            return self._get_result_for_job_id(id, session, child, progress, analysis_id)
+        if self.result_cache is None:
+            with self.Session() as session:
+                return self._get_result_for_job_id(id, session, child, progress, analysis_id)
+        key = (int(id), child, progress, analysis_id)
+        result = self.result_cache.get(key)
+        if result is not None:
+            return copy.deepcopy(result)
+        with self.Session() as session:
+            result = self._get_result_for_job_id(id, session, child, progress, analysis_id)
+        # The output of a DONE job cannot change anymore, short of the job being deleted. A tree reported
+        # complete from its semaphore alone may still be waiting for its funnel job and result row, so it is
+        # not final yet.
+        final = 'output' in result and ('progress' not in result or result['progress']['inprogress'] == 0)
+        self.result_cache.set(key, copy.deepcopy(result), ttl=None if final else self.result_ttl)
+        return result
+
+    def result_cache_stats(self):
+        """ Return the result cache counters, or None if results are not cached """
+        return self.result_cache.stats() if self.result_cache is not None else None
+
+    def _invalidate_results(self, job_ids):
+        """ Drop cached results requested for, or computed from, any of the given jobs """
+        if self.result_cache is not None:
+            job_ids = set(job_ids)
+            self.result_cache.evict(lambda key, result: key[0] in job_ids or result['id'] in job_ids)
 
     def _get_result_for_job_id(self, id, session, child=False, progress=True, analysis_id=None):
         job = self._get_job_by_id(id, session)
@@ -304,19 +777,13 @@ class HiveInstance:
         Determine if the job has completed. If the job has semaphored children, they are also checked
         Also return progress of jobs, completed and total if flag is on
         """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_result_for_job(job, session, progress, analysis_id)
 
     def _get_result_for_job(self, job, session, progress=False, analysis_id=None):
         result = {"id": job.job_id}
         try:
-            if re.search(r"^(_extended_data_id){1}(\s){1}(\d+){1}", job.input_id):
-                extended_data = job.input_id.split(" ")
-                job_input = self._get_analysis_data_input(extended_data[1], session)
-                result['input'] = perl_string_to_python(job_input.data)
-
-            else:
-                result['input'] = perl_string_to_python(job.input_id)
+            result['input'] = self._get_job_input(job, session)
             if job.status == 'DONE' and job.result is not None:
                 result['status'] = 'complete'
                 result['when_completed'] = job.when_completed
@@ -331,35 +798,85 @@ class HiveInstance:
             raise ValueError(f'DB error for job: {job.job_id}') from e
         return result
 
-    def get_all_jobs_progress(self, job_id, analysis_id=None):
+    def get_all_jobs_progress(self, job_id, analysis_id=None, by_analysis=False):
         """
-        Get all jobs from Job table based on given job id and analysis id
+        Count jobs from Job table based on given job id and analysis id
+        If by_analysis is on, counts are also broken down by analysis logic_name under the 'analyses' key
         """
-        with Session() as session:
-            return self._get_all_jobs_progress(job_id, session, analysis_id)
-
-    def _get_all_jobs_progress(self, job_id, session, analysis_id=None):
-        results = {'total': 0, 'inprogress': 0, 'completed': 0, 'failed': 0 }
-        job_pattern = f"{job_id},%"
-
+        with self.Session() as session:
+            return self._get_all_jobs_progress(job_id, session, analysis_id, by_analysis)
+
+    def _get_all_jobs_progress(self, job_id, session, analysis_id=None, by_analysis=False):
+        results = self._new_progress()
+        # param_id_stack starts with the job_id of the job whose parameters were inherited.
+        # A plain (case sensitive) LIKE on a fixed prefix can be resolved from an index.
+        query = session.query(Job.status, func.count(Job.job_id)).filter(
+            Job.param_id_stack.like(f"{job_id},%"))
         if analysis_id:
-            jobs = session.query(Job).filter(and_(Job.param_id_stack.ilike(job_pattern), Job.analysis_id == analysis_id ) ).all()
+            query = query.filter(Job.analysis_id == analysis_id)
+        if by_analysis:
+            results['analyses'] = {}
+            query = query.add_columns(Job.analysis_id).group_by(Job.analysis_id)
+        for row in query.group_by(Job.status):
+            status, count = row[0], row[1]
+            self._add_to_progress(results, status, count)
+            if by_analysis:
+                logic_name = self._get_analysis_name(row[2], session)
+                analysis_progress = results['analyses'].setdefault(logic_name, self._new_progress())
+                self._add_to_progress(analysis_progress, status, count)
+        return results
+
+    @staticmethod
+    def _new_progress():
+        return {'total': 0, 'inprogress': 0, 'completed': 0, 'failed': 0}
+
+    @staticmethod
+    def _add_to_progress(progress, status, count):
+        """ Add count jobs with the given hive status to the progress counters """
+        progress['total'] += count
+        if status == 'DONE':
+            progress['completed'] += count
+        elif status == 'FAILED':
+            progress['failed'] += count
         else:
-            jobs = session.query(Job).filter(Job.param_id_stack.ilike(job_pattern) ).all()
+            progress['inprogress'] += count
 
-        for job in jobs:
-            results['total'] += 1
-            if job.status == 'DONE':
-                results['completed'] += 1
-            elif job.status == 'FAILED':
-                results['failed'] += 1
-            else:
-                results['inprogress'] += 1
-        return results
+    def get_pipeline_summary(self, max_age=None):
+        """
+        Count jobs by analysis logic_name and status, beekeeper style, along with the number of jobs
+        the semaphored jobs of each analysis are still waiting for:
+        {logic_name: {'total': n, 'statuses': {status: n}, 'semaphore_backlog': n}}
+        If max_age is set, a summary computed less than max_age seconds ago is returned instead,
+        so that concurrent callers share a single query
+        """
+        if max_age is None:
+            with self.Session() as session:
+                return self._get_pipeline_summary(session)
+        with self._summary_lock:
+            if self._summary is None or time.monotonic() - self._summary[0] > max_age:
+                with self.Session() as session:
+                    self._summary = (time.monotonic(), self._get_pipeline_summary(session))
+            return copy.deepcopy(self._summary[1])
+
+    def _get_pipeline_summary(self, session):
+        summary = {}
+        query = session.query(Analysis.logic_name, Job.status, func.count(Job.job_id),
+                              func.sum(Semaphore.local_jobs_counter)) \
+            .select_from(Analysis) \
+            .outerjoin(Job, Job.analysis_id == Analysis.analysis_id) \
+            .outerjoin(Semaphore, Semaphore.dependent_job_id == Job.job_id) \
+            .group_by(Analysis.logic_name, Job.status)
+        for logic_name, status, count, backlog in query:
+            analysis = summary.setdefault(logic_name, {'total': 0, 'statuses': {}, 'semaphore_backlog': 0})
+            if status is not None:
+                analysis['total'] += count
+                analysis['statuses'][status] = count
+                analysis['semaphore_backlog'] += int(backlog or 0)
+        return summary
 
     def get_last_job_progress(self, job):
         """ Return last job progress line if exists, else None """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_last_job_progress(job, session)
 
     def _get_last_job_progress(self, job, session):
@@ -374,7 +891,7 @@ class HiveInstance:
         Return number of completed jobs and total of jobs
         If there is data in the job_progress table, return progress message
         """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_jobs_progress(job, session)
 
     def _get_jobs_progress(self, job, session):
@@ -386,60 +903,186 @@ class HiveInstance:
             return {"complete": complete, "total": total, "message": last_job_progress_msg.message}
         total = 1
         complete = 0
-        parent_job = self._get_job_by_id(job.job_id, session)
+        parent_job = self._get_job_status(job.job_id, session)
         if parent_job.status == 'DONE':
             complete += 1
-        for child_job in session.query(Job).filter(Job.prev_job_id == job.job_id).all():
+        for child_job in self._get_job_children_status(job.job_id, session):
             total += 1
             if child_job.status == 'DONE':
                 complete += 1
         return {"complete": complete, "total": total}
 
+    def watch_jobs(self, job_ids):
+        """
+        Return a concurrent.futures.Future per job id, resolved with the status of the job tree ('complete' or
+        'failed') once it ends, or with a ValueError if the job does not exist
+        All the jobs watched on this instance are polled together by a single background thread
+        """
+        return self._waiter.watch(job_ids)
+
+    def wait_for_jobs(self, job_ids, timeout=None):
+        """
+        Wait up to timeout seconds (forever if None) for the job trees to end, see watch_jobs
+        Return a dict mapping each job id to its final tree status, or to its latest status if it is still
+        running
+        """
+        futures = self.watch_jobs(job_ids)
+        wait(futures.values(), timeout)
+        latest = {job_id: self._waiter.last_status(job_id) for job_id in futures}
+        # stop polling the jobs still running, unless other waiters wait for them
+        for future in futures.values():
+            future.cancel()
+        return {job_id: latest[job_id] if future.cancelled() else future.result()
+                for job_id, future in futures.items()}
+
     def get_job_tree_status(self, job):
         """ Recursively check all children of a job """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_job_tree_status(job, session)
 
     def _get_job_tree_status(self, job, session):
+        if self._supports_recursive_cte(session):
+            return self._get_job_tree_statuses_cte([job], session)[job.job_id]
+        return self._get_job_tree_status_recursive(job, session)
+
+    def _get_job_tree_status_recursive(self, job, session):
+        logger.debug("get_job_tree_status :: job: %s", job)
+        children = self._get_job_children_status(job.job_id, session)
         # check for semaphores
         semaphore_data = None
-        logger.debug("get_job_tree_status :: job: %s", job)
-        semaphored_job = session.query(Job).filter(Job.prev_job_id == job.job_id and job.status == 'SEMAPHORED').first()
-        logger.debug("get_job_tree_status :: semaphored_job: %s", semaphored_job)
-        if semaphored_job is not None:
-            semaphore_data = self._get_semaphore_data(semaphored_job.job_id, session)
+        if children:
+            semaphore_data = self._get_semaphore_data(children[0].job_id, session)
         logger.debug("get_job_tree_status :: semaphore_data: %s", semaphore_data)
         if semaphore_data is not None and semaphore_data.local_jobs_counter > 0:
             return self._check_semaphores_for_job(semaphore_data, session)
-        if job.status == 'FAILED':
-            return 'failed'
-        if job.status == 'READY':
-            return 'submitted'
-        if job.status == 'RUN':
-            return 'running'
         if job.status == 'DONE':
-            for child_job in session.query(Job).filter(Job.prev_job_id == job.job_id).all():
-                child_status = self._get_job_tree_status(child_job, session)
+            for child_job in children:
+                child_status = self._get_job_tree_status_recursive(child_job, session)
                 if child_status != 'complete':
                     return child_status
             return 'complete'
-        return 'incomplete'
+        return JOB_TREE_STATUS.get(job.status, 'incomplete')
+
+    def _get_job_tree_statuses_cte(self, jobs, session):
+        """
+        Walk the job trees rooted at jobs with one recursive query per chunk of roots
+        and fold them into the same status _get_job_tree_status_recursive would return
+        """
+        statuses = {}
+        for chunk in _chunked(jobs):
+            forest = _JobForest()
+            for row in session.execute(self._job_tree_query([job.job_id for job in chunk])):
+                forest.add(row.job_id, row.prev_job_id, row.status, row.semaphore_id, row.local_jobs_counter)
+            statuses.update(self._fold_job_forest(forest, chunk, session))
+        return statuses
+
+    def _get_job_tree_statuses_by_level(self, jobs, session):
+        """
+        Walk the job trees rooted at jobs one level at a time, reading each level in one query
+        (per chunk of jobs), for backends without recursive queries
+        """
+        forest = _JobForest()
+        root_ids = {job.job_id for job in jobs}
+        for chunk in _chunked(root_ids):
+            for row in session.execute(self._job_rows_query(_job.c.job_id.in_(chunk))):
+                forest.add(row.job_id, row.prev_job_id, row.status, row.semaphore_id, row.local_jobs_counter)
+        # as in _job_tree_query, the walk visits the children of the roots and of DONE jobs, and the children
+        # of every visited job are needed, since the semaphore of the first one is checked before the job
+        # status
+        expanded = set()
+        level = root_ids
+        while level:
+            expanded.update(level)
+            next_level = set()
+            for chunk in _chunked(level):
+                for row in session.execute(self._job_rows_query(_job.c.prev_job_id.in_(chunk))):
+                    forest.add(row.job_id, row.prev_job_id, row.status, row.semaphore_id,
+                               row.local_jobs_counter)
+                    if (row.prev_job_id in root_ids or forest.statuses[row.prev_job_id] == 'DONE') \
+                            and row.job_id not in expanded:
+                        next_level.add(row.job_id)
+            level = next_level
+        return self._fold_job_forest(forest, jobs, session)
+
+    def _fold_job_forest(self, forest, jobs, session):
+        """ Resolve the pending semaphores of a forest at once, then fold the tree of each job """
+        missing = forest.missing([job.job_id for job in jobs])
+        if missing:
+            raise ValueError("Job %s not found" % missing[0])
+        semaphore_statuses = self._get_semaphore_ids_status(forest.pending_semaphores(), session)
+        # as in the python walk, the supplied job status prevails over the stored one
+        return {job.job_id: forest.fold(job.job_id, job.status, semaphore_statuses) for job in jobs}
+
+    @staticmethod
+    def _job_tree_query(job_ids):
+        """
+        Recursive query listing the trees rooted at job_ids along with the semaphore each job depends on.
+        Only children of the roots and of DONE jobs are expanded further, as other statuses end the walk.
+        """
+        tree = select(_job.c.job_id.label('root_id'), _job.c.job_id, _job.c.prev_job_id, _job.c.status,
+                      literal(1).label('expand')) \
+            .where(_job.c.job_id.in_(job_ids)) \
+            .cte('job_tree', recursive=True)
+        parent = tree.alias('parent')
+        child = _job.alias('child')
+        tree = tree.union_all(
+            select(parent.c.root_id, child.c.job_id, child.c.prev_job_id, child.c.status,
+                   case((or_(parent.c.status == 'DONE', parent.c.job_id == parent.c.root_id), 1), else_=0))
+            .where(child.c.prev_job_id == parent.c.job_id, parent.c.expand == 1)
+        )
+        return select(tree.c.job_id, tree.c.prev_job_id, tree.c.status,
+                      _semaphore.c.semaphore_id, _semaphore.c.local_jobs_counter) \
+            .select_from(tree.outerjoin(_semaphore, _semaphore.c.dependent_job_id == tree.c.job_id))
+
+    @staticmethod
+    def _job_rows_query(condition):
+        """ Query listing the jobs matching condition along with the semaphore each job depends on """
+        return select(_job.c.job_id, _job.c.prev_job_id, _job.c.status,
+                      _semaphore.c.semaphore_id, _semaphore.c.local_jobs_counter) \
+            .select_from(_job.outerjoin(_semaphore, _semaphore.c.dependent_job_id == _job.c.job_id)) \
+            .where(condition)
+
+    def get_semaphores_status(self, jobs):
+        """
+        Find the semaphore each of the jobs is held by, i.e. the one its first child depends on as checked by
+        get_job_tree_status, and map the job_id of the jobs held by a pending semaphore
+        (local_jobs_counter > 0) to the status of that semaphore: 'complete', 'failed' or 'incomplete'
+        Semaphores are found with one query, and their statuses with a single count grouped by semaphore and
+        status
+        """
+        with self.Session() as session:
+            return self._get_semaphores_status(jobs, session)
+
+    def _get_semaphores_status(self, jobs, session):
+        held_by = {}
+        for chunk in _chunked(job.job_id for job in jobs):
+            first_children = select(_job.c.prev_job_id, func.min(_job.c.job_id).label('job_id')) \
+                .where(_job.c.prev_job_id.in_(chunk)).group_by(_job.c.prev_job_id).subquery()
+            query = select(first_children.c.prev_job_id, _semaphore.c.semaphore_id) \
+                .join_from(first_children, _semaphore,
+                           _semaphore.c.dependent_job_id == first_children.c.job_id) \
+                .where(_semaphore.c.local_jobs_counter > 0)
+            held_by.update(session.execute(query).all())
+        semaphore_statuses = self._get_semaphore_ids_status(set(held_by.values()), session)
+        return {job_id: semaphore_statuses[semaphore_id] for job_id, semaphore_id in held_by.items()}
 
     def get_job_child(self, job):
         """ Get child job for a given parent job """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_job_child(job, session)
 
     def _get_job_child(self, job, session):
-        return session.query(Job).filter(Job.prev_job_id == job.job_id).first()
+        return session.execute(_first_child_stmt, {'job_id': job.job_id}).scalars().first()
 
     def get_job_parent(self, job):
         """ Get parent job for a given children job """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_job_parent(job, session)
 
     def _get_job_parent(self, job, session):
-        return session.query(Job).filter(Job.job_id == job.prev_job_id).first()
+        if job.prev_job_id is None:
+            return None
+        return session.execute(_job_by_id_stmt, {'job_id': job.prev_job_id}).scalars().first()
 
     def get_semaphored_jobs(self, job, status=None):
         """
@@ -448,7 +1091,7 @@ class HiveInstance:
         'failed' indicates that at least one child has failed
         'incomplete' indicates that at least one child is running or ready
         """
-        with Session() as session:
+        with self.Session() as session:
             return self._get_semaphored_jobs(job, session, status)
 
     def _get_semaphored_jobs(self, job, session, status=None):
@@ -460,27 +1103,52 @@ class HiveInstance:
 
     def check_semaphores_for_job(self, semaphore_data):
         """ Find all jobs that are semaphored children of the nominated job, and check whether they have completed """
-        with Session() as session:
+        with self.Session() as session:
             return self._check_semaphores_for_job(semaphore_data, session)
 
     def _check_semaphores_for_job(self, semaphore_data, session):
-        status = 'complete'
         jobs = dict(session.query(Job.status, func.count(Job.status)).filter(
             semaphore_data.semaphore_id == Job.controlled_semaphore_id).group_by(Job.status).all())
         logger.debug("check_semaphores_for_job :: jobs: %s", jobs)
-        if jobs.get('FAILED', 0) > 0:
-            status = 'failed'
-        elif jobs.get('READY', 0) > 0 or jobs.get('RUN', 0) > 0 or jobs.get('SEMAPHORED', 0) > 0:
-            status = 'incomplete'
-        return status
-
-    def get_all_results(self, analysis_name, child=False):
-        """Find all jobs from the specified analysis"""
-        with Session() as session:
-            return self._get_all_results(analysis_name, session, child)
-
-    def _get_all_results(self, analysis_name, session, child=False):
-        jobs = session.query(Job).join(Analysis).filter(Analysis.logic_name == analysis_name).all()
+        return self._semaphore_status(jobs)
+
+    def _get_semaphore_ids_status(self, semaphore_ids, session):
+        """ Status of several semaphores from a single count of their controlled jobs grouped by status """
+        if not semaphore_ids:
+            return {}
+        counts = defaultdict(dict)
+        for chunk in _chunked(semaphore_ids):
+            query = session.query(Job.controlled_semaphore_id, Job.status, func.count(Job.job_id)).filter(
+                Job.controlled_semaphore_id.in_(chunk)).group_by(Job.controlled_semaphore_id, Job.status)
+            for semaphore_id, status, count in query:
+                counts[semaphore_id][status] = count
+        return {semaphore_id: self._semaphore_status(counts[semaphore_id]) for semaphore_id in semaphore_ids}
+
+    @staticmethod
+    def _semaphore_status(counts):
+        """ Reduce controlled jobs counts by status to 'complete', 'failed' or 'incomplete' """
+        if counts.get('FAILED', 0) > 0:
+            return 'failed'
+        if counts.get('READY', 0) > 0 or counts.get('RUN', 0) > 0 or counts.get('SEMAPHORED', 0) > 0:
+            return 'incomplete'
+        return 'complete'
+
+    def get_all_results(self, analysis_name, child=False, bulk=True):
+        """
+        Find all jobs from the specified analysis
+        With bulk on (default), children, extended inputs and statuses are loaded for all the jobs at once,
+        so the number of queries does not grow with the number of jobs
+        """
+        with self.Session() as session:
+            return self._get_all_results(analysis_name, session, child, bulk)
+
+    def _get_all_results(self, analysis_name, session, child=False, bulk=True):
+        analysis_id = self._get_analysis_id(analysis_name, session)
+        if analysis_id is None:
+            return []
+        jobs = session.query(Job).filter(Job.analysis_id == analysis_id).all()
+        if bulk:
+            return self._get_results_for_jobs(jobs, session, child)
         if child:
             return list(
                 map(lambda job: self._get_result_for_job(self._get_job_child(job, session), session) if (
@@ -489,9 +1157,116 @@ class HiveInstance:
             )
         return list(map(lambda job: self._get_result_for_job(job, session), jobs))
 
+    def iter_results(self, analysis_name, child=False, batch_size=1000):
+        """
+        Generator version of get_all_results, yielding result dicts as jobs are read batch_size at a time
+        Jobs are paged by job_id and released once their results are yielded, so memory stays bounded
+        however many jobs the analysis has
+        """
+        with self.Session() as session:
+            analysis_id = self._get_analysis_id(analysis_name, session)
+            if analysis_id is None:
+                return
+            last_job_id = 0
+            while True:
+                jobs = session.query(Job).filter(Job.analysis_id == analysis_id, Job.job_id > last_job_id) \
+                    .order_by(Job.job_id).limit(batch_size).all()
+                if not jobs:
+                    return
+                last_job_id = jobs[-1].job_id
+                results = self._get_results_for_jobs(jobs, session, child)
+                # only keep the page results while they are consumed, not the jobs themselves
+                session.expunge_all()
+                del jobs
+                yield from results
+
+    def _get_results_for_jobs(self, jobs, session, child=False):
+        """ Set based equivalent of calling _get_result_for_job on each job (or its child if child is on) """
+        try:
+            if child:
+                children = self._get_jobs_first_child(jobs, session)
+                jobs = [children.get(job.job_id, job) for job in jobs]
+            extended_data_ids = {self._extended_data_id(job) for job in jobs} - {None}
+            extended_inputs = self._get_analysis_data_inputs(extended_data_ids, session)
+            pending = [job for job in jobs if not (job.status == 'DONE' and job.result is not None)]
+            tree_statuses = self._get_job_tree_statuses(pending, session)
+        except SQLAlchemyError as e:
+            raise ValueError('DB error while retrieving results') from e
+        results = []
+        for job in jobs:
+            result = {"id": job.job_id}
+            try:
+                extended_data_id = self._extended_data_id(job)
+                if extended_data_id is not None:
+                    result['input'] = extended_inputs[extended_data_id]
+                else:
+                    result['input'] = perl_string_to_python(job.input_id)
+                if job.status == 'DONE' and job.result is not None:
+                    result['status'] = 'complete'
+                    result['when_completed'] = job.when_completed
+                    result['output'] = job.result.output_dict()
+                else:
+                    result['status'] = tree_statuses[job.job_id]
+            except (ValueError, KeyError) as e:
+                raise ValueError(f'Cannot retrieve results for job: {job.job_id}') from e
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _extended_data_id(job):
+        """ Return the analysis_data_id holding the job input, if it is too long to fit in the job row """
+        match = EXTENDED_DATA_RE.search(job.input_id)
+        return int(match.group(3)) if match else None
+
+    def _get_jobs_first_child(self, jobs, session):
+        """ Map each job_id to its first child job, for the jobs which have one """
+        children = {}
+        for chunk in _chunked(job.job_id for job in jobs):
+            first_child_ids = select(func.min(Job.job_id)).where(Job.prev_job_id.in_(chunk)) \
+                .group_by(Job.prev_job_id)
+            for child_job in session.query(Job).filter(Job.job_id.in_(first_child_ids)):
+                children[child_job.prev_job_id] = child_job
+        return children
+
+    def _get_job_tree_statuses(self, jobs, session):
+        """ Map each job_id to the status of its job tree """
+        if not jobs:
+            return {}
+        if self._supports_recursive_cte(session):
+            return self._get_job_tree_statuses_cte(jobs, session)
+        return self._get_job_tree_statuses_by_level(jobs, session)
+
+    def delete_jobs(self, job_ids, include_children=True, include_parents=True):
+        """
+        Delete the given jobs along with their result, log_message and job_progress rows, in a single
+        transaction. Direct children and parents of the jobs are deleted too, unless include_children or
+        include_parents are off
+        Return the sorted list of deleted job ids
+        """
+        with self.Session() as session:
+            return self._delete_jobs(job_ids, session, include_children, include_parents)
+
+    def _delete_jobs(self, job_ids, session, include_children=True, include_parents=True):
+        deleted_ids = set()
+        for chunk in _chunked({int(job_id) for job_id in job_ids}):
+            conditions = [_job.c.job_id.in_(chunk)]
+            if include_children:
+                conditions.append(_job.c.prev_job_id.in_(chunk))
+            if include_parents:
+                parent_ids = select(_job.c.prev_job_id).where(_job.c.job_id.in_(chunk))
+                conditions.append(_job.c.job_id.in_(parent_ids))
+            deleted_ids.update(session.execute(select(_job.c.job_id).where(or_(*conditions))).scalars())
+        for chunk in _chunked(sorted(deleted_ids)):
+            for table in (Result.__table__, LogMessage.__table__, JobProgress.__table__, _job):
+                session.execute(delete(table).where(table.c.job_id.in_(chunk)))
+        session.commit()
+        logger.debug("Deleted %s jobs", len(deleted_ids))
+        self._invalidate_results(deleted_ids)
+        return sorted(deleted_ids)
+
     def delete_job_by_id(self, job_id, child=False):
         """Delete a job from the hive database given its id"""
-        with Session() as session:
+        with self.Session() as session:
             return self._delete_job_by_id(job_id, session, child)
 
     def _delete_job_by_id(self, job_id, session, child=False):
@@ -502,20 +1277,23 @@ class HiveInstance:
         """Delete a job from the hive database
            If child flag turn on, try to delete child job if exist
            Also get parent job if exist and delete it """
-        with Session() as session:
+        with self.Session() as session:
             return self._delete_job(job, session, child)
 
     def _delete_job(self, job, session, child=False):
+        deleted_ids = [job.job_id]
         parent_job = self._get_job_parent(job, session)
         if child:
             child_job = self._get_job_child(job, session)
             if child_job is not None:
+                deleted_ids.append(child_job.job_id)
                 logger.debug("Deleting children job %s", child_job.job_id)
                 if child_job.result is not None:
                     session.delete(child_job.result)
                 session.delete(child_job)
                 session.commit()
         if parent_job is not None:
+            deleted_ids.append(parent_job.job_id)
             logger.debug("Deleting parent job %s", parent_job.job_id)
             if parent_job.result is not None:
                 session.delete(parent_job.result)
@@ -526,3 +1304,190 @@ class HiveInstance:
             session.delete(job.result)
         session.delete(job)
         session.commit()
+        self._invalidate_results(deleted_ids)
+
+    def check_indexes(self, create_missing=False):
+        """
+        Check that the columns HiveInstance filters on (HOT_PATH_PREDICATES) lead an index, as this depends
+        on the hive schema version, and EXPLAIN the lookup on each of them
+        If create_missing is on, a secondary index is created on each column lacking one: only use it on
+        databases you own
+        Return an IndexCheck per column, tables missing from the schema are skipped
+        """
+        with self.Session() as session:
+            return self._check_indexes(session, create_missing)
+
+    def _check_indexes(self, session, create_missing=False):
+        tables = set(inspect(session.connection()).get_table_names())
+        checks = []
+        for table, column_name, predicate in HOT_PATH_PREDICATES:
+            if table.name not in tables:
+                logger.debug("Table %s not in the schema, not checked", table.name)
+                continue
+            # the connection is released by each commit
+            connection = session.connection()
+            index = self._leading_index(inspect(connection), table.name, column_name)
+            created = False
+            if index is None and create_missing:
+                index = f"{table.name}_{column_name}_idx"
+                preparer = connection.dialect.identifier_preparer
+                connection.execute(text(f"CREATE INDEX {preparer.quote(index)} "
+                                        f"ON {preparer.quote(table.name)} ({preparer.quote(column_name)})"))
+                session.commit()
+                created = True
+                logger.info("Created index %s on %s.%s", index, table.name, column_name)
+            plan, rows = self._explain(session, select(table).where(predicate(table.c[column_name])))
+            if index is None:
+                logger.warning("No index on %s.%s, lookups read %s rows", table.name, column_name,
+                               rows if rows is not None else "all the")
+            checks.append(IndexCheck(table.name, column_name, index, plan, rows, created))
+        return checks
+
+    @staticmethod
+    def _leading_index(inspector, table_name, column_name):
+        """ Return the name of an index of the table whose first column is column_name, or None """
+        for index in inspector.get_indexes(table_name) + inspector.get_unique_constraints(table_name):
+            if index['column_names'][:1] == [column_name]:
+                return index['name']
+        return None
+
+    @staticmethod
+    def _explain(session, query):
+        """ Return the access path of the query and the number of rows it is estimated to read """
+        dialect = session.connection().dialect
+        sql = str(query.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+        if dialect.name == 'sqlite':
+            plan = '; '.join(row[-1] for row in session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+            # SQLite does not estimate rows, a full scan reads the whole table
+            rows = None
+            if plan.startswith('SCAN') and ' INDEX ' not in plan:
+                rows = session.execute(select(func.count()).select_from(query.get_final_froms()[0])).scalar()
+            return plan, rows
+        if dialect.name == 'mysql':
+            row = session.execute(text(f"EXPLAIN {sql}")).mappings().first()
+            return f"{row['type']} {row['key'] or ''}".strip(), row['rows']
+        return None, None
+
+
+class HiveRegistry:
+    """
+    Registry of HiveInstance objects, one per database URL, each with its own engine and bounded connection
+    pool. Pools of hives left unused for idle_timeout seconds are disposed of (their connections closed); they
+    are reopened on next use. map() runs the same query against all the registered hives at once, in a thread
+    pool.
+
+    Attributes:
+    pool_size     -- connections kept open per hive (ignored for SQLite)
+    max_overflow  -- extra connections allowed per hive under load (ignored for SQLite)
+    idle_timeout  -- seconds after which the pool of an unused hive is disposed of
+    max_workers   -- threads used by map()
+    hive_options  -- other HiveInstance arguments, e.g. timeout or result_cache
+    """
+
+    def __init__(self, pool_size=2, max_overflow=3, idle_timeout=600, max_workers=8, **hive_options):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.idle_timeout = idle_timeout
+        self.max_workers = max_workers
+        self.hive_options = hive_options
+        self._hives = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __len__(self):
+        return len(self._hives)
+
+    def __contains__(self, url):
+        return url in self._hives
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def urls(self):
+        """ URLs of the registered hives """
+        return list(self._hives)
+
+    def register(self, url):
+        """ Register the hive database at url if needed, and return its HiveInstance """
+        with self._lock:
+            hive = self._hives.get(url)
+            if hive is None:
+                options = dict(self.hive_options)
+                if make_url(url).get_backend_name() != 'sqlite':
+                    options.setdefault('pool_size', self.pool_size)
+                    options.setdefault('max_overflow', self.max_overflow)
+                hive = HiveInstance(url, **options)
+                self._hives[url] = hive
+                logger.debug("Registered hive %s", hive.engine.url)
+            self._last_used[url] = time.monotonic()
+            return hive
+
+    def get(self, url):
+        """ Return the HiveInstance registered for url, raise KeyError if there is none """
+        with self._lock:
+            hive = self._hives[url]
+            self._last_used[url] = time.monotonic()
+        self.dispose_idle()
+        return hive
+
+    def unregister(self, url):
+        """ Forget the hive registered for url and close its connections """
+        with self._lock:
+            hive = self._hives.pop(url)
+            self._last_used.pop(url)
+        hive.engine.dispose()
+
+    def dispose_idle(self):
+        """ Close the pooled connections of the hives unused for idle_timeout seconds, return their URLs """
+        now = time.monotonic()
+        with self._lock:
+            idle = [url for url, last_used in self._last_used.items()
+                    if last_used is not None and now - last_used > self.idle_timeout]
+            for url in idle:
+                # None marks the pool as already disposed of until the hive is used again
+                self._last_used[url] = None
+                logger.debug("Disposing of idle hive %s", self._hives[url].engine.url)
+                self._hives[url].engine.dispose()
+        return idle
+
+    def map(self, method, *args, urls=None, return_exceptions=False, **kwargs):
+        """
+        Call method on each registered hive (or on the hives at urls) concurrently and map each URL to its
+        result. method is either the name of a HiveInstance method or a callable taking a HiveInstance as
+        first argument, it is called with the remaining args and kwargs
+        If return_exceptions is on, errors are returned in place of results instead of being raised
+        """
+        hives = [(url, self.get(url)) for url in (self.urls if urls is None else urls)]
+        call = (lambda hive: getattr(hive, method)(*args, **kwargs)) if isinstance(method, str) \
+            else (lambda hive: method(hive, *args, **kwargs))
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='hive')
+        futures = {url: self._executor.submit(call, hive) for url, hive in hives}
+        results = {}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                logger.debug("Error querying hive %s: %s", url, e)
+                results[url] = e
+        return results
+
+    def close(self):
+        """ Stop the thread pool and close the connections of all registered hives """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            hives = list(self._hives.values())
+            self._hives.clear()
+            self._last_used.clear()
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for hive in hives:
+            hive.engine.dispose()
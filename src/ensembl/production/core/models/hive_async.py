@@ -0,0 +1,127 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import asyncio
+import copy
+import functools
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.util import greenlet_spawn
+
+from ensembl.production.core.models.hive import HiveInstance, JobStatus
+
+__all__ = ['AsyncHiveInstance']
+
+# HiveInstance methods provided as coroutines by AsyncHiveInstance, with the same arguments and results
+ASYNC_METHODS = (
+    'get_job_by_id', 'get_job_status', 'get_jobs_status', 'get_job_children_status', 'get_worker_id',
+    'get_jobs_failure_msg', 'get_last_log_messages', 'get_job_failure_msg_by_id', 'get_worker_process_id',
+    'get_analysis_by_name', 'get_analysis_id', 'get_analysis_name', 'create_job', 'create_jobs',
+    'get_analysis_data_input', 'get_analysis_data_inputs', 'get_semaphore_data', 'get_result_for_job_id',
+    'get_result_for_job', 'get_all_jobs_progress', 'get_last_job_progress', 'get_jobs_progress',
+    'get_job_tree_status', 'get_semaphores_status', 'get_job_child', 'get_job_parent', 'get_semaphored_jobs',
+    'check_semaphores_for_job', 'get_all_results', 'delete_jobs', 'delete_job_by_id', 'delete_job',
+    'check_indexes',
+)
+
+
+class _GreenletHiveInstance(HiveInstance):
+    """ HiveInstance on the synchronous facade of an AsyncEngine: run its methods through greenlet_spawn """
+
+    def _create_engine(self, url, timeout, **engine_options):
+        self.async_engine = create_async_engine(url, pool_recycle=timeout, **engine_options)
+        return self.async_engine.sync_engine
+
+
+class AsyncHiveInstance:
+    """
+    Asyncio version of HiveInstance, on an async driver, e.g. sqlite+aiosqlite:// or mysql+aiomysql://
+    The HiveInstance methods listed in ASYNC_METHODS are coroutines here: each runs the same code as its
+    HiveInstance counterpart, in its own session, with the database I/O awaited on the event loop rather than
+    blocking it. Calls can therefore be run concurrently with asyncio.gather, see get_job_context.
+    wait_for_jobs, watch_jobs and iter_results, which rely on threads or generators, are not provided.
+
+    Attributes:
+    hive   -- underlying HiveInstance, its caches and statistics are shared
+    engine -- AsyncEngine
+    """
+
+    def __init__(self, url, timeout=3600, **options):
+        """ Connect to the hive database at url, options are those of HiveInstance """
+        self.hive = _GreenletHiveInstance(url, timeout, **options)
+        self.url = url
+        self.engine = self.hive.async_engine
+        self._summary_lock = asyncio.Lock()
+
+    async def dispose(self):
+        """ Close the connections of the engine pool """
+        await self.engine.dispose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.dispose()
+
+    @property
+    def analysis_dict(self):
+        return self.hive.analysis_dict
+
+    def result_cache_stats(self):
+        return self.hive.result_cache_stats()
+
+    def input_cache_stats(self):
+        return self.hive.input_cache_stats()
+
+    def statement_cache_stats(self):
+        return self.hive.statement_cache_stats()
+
+    async def get_pipeline_summary(self, max_age=None):
+        """ See HiveInstance.get_pipeline_summary, concurrent callers accepting a max_age share one query """
+        if max_age is None:
+            return await greenlet_spawn(self.hive.get_pipeline_summary)
+        # HiveInstance guards its summary with a thread lock, which cannot be held across an await
+        async with self._summary_lock:
+            summary = self.hive._summary
+            if summary is None or time.monotonic() - summary[0] > max_age:
+                self.hive._summary = (time.monotonic(), await greenlet_spawn(self.hive.get_pipeline_summary))
+            return copy.deepcopy(self.hive._summary[1])
+
+    async def get_job_context(self, id):
+        """
+        Read a job along with its first child, the semaphore it depends on and its last log message,
+        the four lookups running concurrently: {'job': Job, 'child': Job, 'semaphore': Semaphore,
+        'log_message': LogMessage}, missing ones are None
+        """
+        job, child, semaphore, messages = await asyncio.gather(
+            self.get_job_by_id(id),
+            # only the job_id of the parent is needed to find its child
+            self.get_job_child(JobStatus(int(id), None, None, None)),
+            self.get_semaphore_data(id),
+            self.get_last_log_messages([id]),
+        )
+        return {'job': job, 'child': child, 'semaphore': semaphore, 'log_message': messages.get(job.job_id)}
+
+
+def _coroutine(name):
+    method = getattr(HiveInstance, name)
+
+    @functools.wraps(method)
+    async def coroutine(self, *args, **kwargs):
+        return await greenlet_spawn(getattr(self.hive, name), *args, **kwargs)
+
+    return coroutine
+
+
+for _name in ASYNC_METHODS:
+    setattr(AsyncHiveInstance, _name, _coroutine(_name))
@@ -13,8 +13,9 @@
 
 import datetime
 import logging
+from collections import defaultdict
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Enum, func, text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -114,21 +115,30 @@ class LockException(Exception):
 
 Session = sessionmaker()
 
+# Ways of preventing concurrent ResourceLocker calls from granting conflicting locks
+LOCKING_MODES = ('table', 'row')
+
 
 class ResourceLocker:
     """Utility class for the locking and unlocking of resources
     """
 
-    def __init__(self, url, timeout=3600):
+    def __init__(self, url, timeout=3600, locking='table'):
         """Create a new ResourceLocker instance
         Attributes:
           url - URL of backing database
           timeout - (optional) time in seconds to keep connections to database open. Defaults to 3600s
+          locking - (optional) 'table' to serialise all changes with LOCK TABLES on MySQL (default), or 'row'
+                    to only lock the row of the resource being locked within a transaction, so that locks on
+                    different resources are granted in parallel. Both can be used on the same database.
         """
+        if locking not in LOCKING_MODES:
+            raise ValueError("Unsupported locking: {}".format(str(locking)))
         self.url = url
-        engine = create_engine(url, pool_recycle=timeout, echo=False)
-        Base.metadata.create_all(engine)
-        Session.configure(bind=engine)
+        self.locking = locking
+        self.engine = create_engine(url, pool_recycle=timeout, echo=False)
+        Base.metadata.create_all(self.engine)
+        Session.configure(bind=self.engine)
 
     def get_client(self, name, session=None):
         """Get or create a client with the given name"""
@@ -160,11 +170,10 @@ class ResourceLocker:
         If it has already been created, return it.
         If a duplicate exists, retry the method.
         """
-        has_session = 'session' in kwargs
-        session = kwargs.pop('session', Session())
-        if session == None:
-            has_session = False
-            session = Session()
+        session = kwargs.pop('session', None)
+        has_session = session is not None
+        if not has_session:
+            session = self._new_session()
         try:
             obj = session.query(obj_type).filter_by(**kwargs).first()
             if obj:
@@ -172,20 +181,23 @@ class ResourceLocker:
             else:
                 obj = obj_type(**kwargs)
                 self._lock_db(session)
-                session.add(obj)
-                session.commit()
-                self._unlock_db(session)
+                try:
+                    session.add(obj)
+                    session.commit()
+                finally:
+                    self._unlock_db(session)
                 # lazily load attrs so they can be accessed in a detached object
                 lazy_load(obj)
                 return obj
         except IntegrityError:
-            # duplicate entry, so try again to fetch with a fresh session
+            # duplicate entry created concurrently, so roll back and try again to fetch it
+            session.rollback()
             kwargs['session'] = session
             return self._get_object(obj_type, **kwargs)
         finally:
             if has_session == False:
                 logging.debug("Closing session")
-                session.close()
+                self._close_session(session)
 
     def get_locks(self, **kwargs):
         """Fetch current locks from the database
@@ -242,41 +254,91 @@ class ResourceLocker:
           LockException if resource cannot be locked
           ValueException if lock type not read or write
         """
-        logging.info("Locking {} for {} for {}".format(client_name, resource_uri, lock_type))
-        session = Session()
-        client = self.get_client(client_name, session)
-        resource = self.get_resource(resource_uri, session)
+        return self.lock_many(client_name, [(resource_uri, lock_type)])[0]
+
+    def lock_many(self, client_name, requests):
+        """Lock several resources together: either all the locks are obtained, or none is.
+        Conflicts are checked and locks created in a single transaction, resources being locked in order of
+        URI so that concurrent calls on overlapping resources cannot deadlock.
+        Arguments:
+          client_name - name of client
+          requests - list of (resource URI, lock type) pairs, lock type being read or write
+        Returns:
+          List of ResourceLock, in the order of requests
+        Raises:
+          LockException if any of the resources cannot be locked, listing all the conflicts
+          ValueError if a lock type is not read or write, or a resource is requested more than once
+        """
+        requests = list(requests)
+        logging.info("Locking {} for {}".format(
+            ", ".join("{} for {}".format(resource_uri, lock_type) for resource_uri, lock_type in requests),
+            client_name))
+        for resource_uri, lock_type in requests:
+            if lock_type not in ('read', 'write'):
+                raise ValueError("Unsupported lock_type: {}".format(str(lock_type)))
+        uris = sorted(resource_uri for resource_uri, lock_type in requests)
+        duplicates = sorted({uri for uri, next_uri in zip(uris, uris[1:]) if uri == next_uri})
+        if duplicates:
+            raise ValueError("Resources requested more than once: {}".format(", ".join(duplicates)))
+        session = self._new_session()
         try:
+            client = self.get_client(client_name, session)
+            resources = self._get_resources(uris, session)
             self._lock_db(session)
-            if (lock_type == 'read'):
+            try:
+                self._lock_resources(session, [resources[uri] for uri in uris])
+                locks = self._add_locks(session, client, [(resources[resource_uri], lock_type)
+                                                          for resource_uri, lock_type in requests])
+                session.commit()
+            finally:
+                self._unlock_db(session)
+            for lock in locks:
+                lazy_load(lock)
+            return locks
+        finally:
+            self._close_session(session)
+
+    def _get_resources(self, uris, session):
+        """Get or create the resources with the given URIs, as a dict by URI"""
+        resources = {resource.uri: resource
+                     for resource in session.query(Resource).filter(Resource.uri.in_(uris))}
+        for uri in uris:
+            if uri not in resources:
+                resources[uri] = self.get_resource(uri, session)
+        return resources
+
+    def _add_locks(self, session, client, requests):
+        """Add the requested (resource, lock type) locks for client to the session
+        Raises:
+          LockException if the locks already held on any of the resources conflict with them
+        """
+        lock_counts = defaultdict(dict)
+        resource_ids = [resource.resource_id for resource, lock_type in requests]
+        for resource_id, lock_type, n_locks in session.query(
+                ResourceLock.resource_id, ResourceLock.lock_type, func.count(ResourceLock.resource_lock_id)) \
+                .filter(ResourceLock.resource_id.in_(resource_ids)) \
+                .group_by(ResourceLock.resource_id, ResourceLock.lock_type):
+            lock_counts[resource_id][lock_type] = n_locks
+        conflicts = []
+        for resource, lock_type in requests:
+            counts = lock_counts[resource.resource_id]
+            if lock_type == 'read':
                 # can only create if no write locks found on resource
-                n_locks = session.query(ResourceLock).filter_by(resource=resource, lock_type='write').count()
-                if (n_locks > 0):
-                    raise LockException(
-                        "Write lock found on {} - cannot lock for reading {}".format(str(n_locks), resource_uri))
-                else:
-                    lock = ResourceLock(resource=resource, client=client, lock_type=lock_type)
-                    session.add(lock)
-                    session.commit()
-                    lazy_load(lock)
-                    return lock
-            elif (lock_type == 'write'):
-                # can only create if no other locks found on resource
-                n_locks = session.query(ResourceLock).filter_by(resource=resource).count()
-                if (n_locks > 0):
-                    raise LockException("{} lock(s) found on {}".format(str(n_locks), resource_uri))
-                else:
-                    lock = ResourceLock(resource=resource, client=client, lock_type=lock_type)
-                    session.add(lock)
-                    session.commit()
-                    lazy_load(lock)
-                    return lock
+                n_locks = counts.get('write', 0)
+                if n_locks > 0:
+                    conflicts.append("Write lock found on {} - cannot lock for reading {}"
+                                     .format(str(n_locks), resource.uri))
             else:
-                raise ValueError("Unsupported lock_type: {}".format(str(lock_type)))
-            self._unlock_db(session)
-        finally:
-            session.close()
-        return
+                # can only create if no other locks found on resource
+                n_locks = sum(counts.values())
+                if n_locks > 0:
+                    conflicts.append("{} lock(s) found on {}".format(str(n_locks), resource.uri))
+        if conflicts:
+            raise LockException("; ".join(conflicts))
+        locks = [ResourceLock(resource=resource, client=client, lock_type=lock_type)
+                 for resource, lock_type in requests]
+        session.add_all(locks)
+        return locks
 
     def unlock(self, lock):
         """Release the specified lock
@@ -287,19 +349,54 @@ class ResourceLocker:
         Raises:
           ValueError if lock not found
         """
-        session = Session()
-        if (type(lock) is int):
-            lock = session.query(ResourceLock).filter_by(resource_lock_id=lock).first()
-            if lock == None:
-                raise ValueError("No lock found for ID " + str(lock))
+        session = self._new_session()
         try:
+            if type(lock) is int:
+                lock_id = lock
+                lock = session.query(ResourceLock).filter_by(resource_lock_id=lock_id).first()
+                if lock == None:
+                    raise ValueError("No lock found for ID " + str(lock_id))
             logging.info("Deleting lock " + str(lock))
             self._lock_db(session)
-            session.delete(lock)
-            session.commit()
-            self._unlock_db(session)
+            try:
+                session.delete(lock)
+                session.commit()
+            finally:
+                self._unlock_db(session)
+        finally:
+            self._close_session(session)
+        return
+
+    def unlock_many(self, locks):
+        """Release several locks in a single statement: either all are released, or none is
+        Arguments:
+          locks - list of ResourceLock or IDs of locks
+        Returns:
+           None
+        Raises:
+          ValueError if any of the locks is not found
+        """
+        lock_ids = sorted({lock if type(lock) is int else lock.resource_lock_id for lock in locks})
+        if not lock_ids:
+            return
+        logging.info("Deleting locks " + ", ".join(str(lock_id) for lock_id in lock_ids))
+        session = self._new_session()
+        try:
+            self._lock_db(session)
+            try:
+                n_deleted = session.query(ResourceLock).filter(ResourceLock.resource_lock_id.in_(lock_ids)) \
+                    .delete(synchronize_session=False)
+                if n_deleted != len(lock_ids):
+                    session.rollback()
+                    found = {lock_id for lock_id, in session.query(ResourceLock.resource_lock_id).filter(
+                        ResourceLock.resource_lock_id.in_(lock_ids))}
+                    raise ValueError("No lock found for IDs " + ", ".join(
+                        str(lock_id) for lock_id in lock_ids if lock_id not in found))
+                session.commit()
+            finally:
+                self._unlock_db(session)
         finally:
-            session.close()
+            self._close_session(session)
         return
 
     def get_clients(self):
@@ -326,23 +423,25 @@ class ResourceLocker:
         Raises:
           ValueError if lock not found
         """
-        session = Session()
-        if (type(client) is int):
-            client = session.query(Client).filter_by(client_id=client).first()
-            if client == None:
-                raise ValueError("No client found for ID ")
-        if (type(client) is str):
-            client = session.query(Client).filter_by(name=client).first()
-            if client == None:
-                raise ValueError("No client found for name")
+        session = self._new_session()
         try:
+            if (type(client) is int):
+                client = session.query(Client).filter_by(client_id=client).first()
+                if client == None:
+                    raise ValueError("No client found for ID ")
+            if (type(client) is str):
+                client = session.query(Client).filter_by(name=client).first()
+                if client == None:
+                    raise ValueError("No client found for name")
             logging.info("Deleting client " + str(client))
             self._lock_db(session)
-            session.delete(client)
-            session.commit()
-            self._unlock_db(session)
+            try:
+                session.delete(client)
+                session.commit()
+            finally:
+                self._unlock_db(session)
         finally:
-            session.close()
+            self._close_session(session)
         return
 
     def get_resources(self):
@@ -369,31 +468,64 @@ class ResourceLocker:
         Raises:
           ValueError if lock not found
         """
-        session = Session()
-        if (type(resource) is int):
-            resource = session.query(Resource).filter_by(resource_id=resource).first()
-            if resource == None:
-                raise ValueError("No client found for ID ")
-        if (type(resource) is str):
-            resource = session.query(Resource).filter_by(uri=resource).first()
-            if resource == None:
-                raise ValueError("No client found for name")
+        session = self._new_session()
         try:
+            if (type(resource) is int):
+                resource = session.query(Resource).filter_by(resource_id=resource).first()
+                if resource == None:
+                    raise ValueError("No client found for ID ")
+            if (type(resource) is str):
+                resource = session.query(Resource).filter_by(uri=resource).first()
+                if resource == None:
+                    raise ValueError("No client found for name")
             logging.info("Deleting resource " + str(resource))
             self._lock_db(session)
-            session.delete(resource)
-            session.commit()
-            self._unlock_db(session)
+            try:
+                session.delete(resource)
+                session.commit()
+            finally:
+                self._unlock_db(session)
         finally:
-            session.close()
+            self._close_session(session)
         return
 
+    def _new_session(self):
+        """Utility to create a session bound to a connection of its own, which its commits do not release:
+        MySQL table locks are then taken and released on the same connection, see _lock_db.
+        Close it with _close_session.
+        """
+        return Session(bind=self.engine.connect())
+
+    def _close_session(self, session):
+        connection = session.get_bind()
+        session.close()
+        connection.close()
+
     def _lock_db(self, session):
-        """Utility to obtain a lock over the MySQL tables to ensure no race condition"""
-        if (self.url.startswith('mysql')):
-            session.execute('lock table client write, resource write, resource_lock write')
+        """Utility to obtain a lock over the MySQL tables to ensure no race condition
+        The session must come from _new_session, the tables stay locked across its commits until _unlock_db
+        """
+        if self.locking == 'table' and self.url.startswith('mysql'):
+            session.connection().execute(text('lock table client write, resource write, resource_lock write'))
 
     def _unlock_db(self, session):
-        """Utility to obtain release a lock over the MySQL tables"""
-        if (self.url.startswith('mysql')):
-            session.execute('unlock tables')
+        """Utility to obtain release a lock over the MySQL tables, on the connection they were locked on"""
+        if self.locking == 'table' and self.url.startswith('mysql'):
+            # UNLOCK TABLES commits any active transaction: discard the work of a failed call first
+            session.rollback()
+            session.get_bind().execute(text('unlock tables'))
+
+    def _lock_resources(self, session, resources):
+        """Utility to lock the rows of resources until the end of the transaction, in row locking mode.
+        Concurrent calls locking the same resources wait for each other, others are not held up.
+        The unique constraints on client name and resource uri prevent duplicates without locking.
+        """
+        if self.locking != 'row':
+            return
+        resource_ids = [resource.resource_id for resource in resources]
+        # start a new transaction, whose snapshot is taken once the row locks are granted: the locks committed
+        # by the calls we may have waited for are then seen (MySQL repeatable read)
+        session.commit()
+        # a single statement, locking the rows in the same order for every caller
+        session.query(Resource).filter(Resource.resource_id.in_(resource_ids)).order_by(Resource.uri) \
+            .with_for_update().all()
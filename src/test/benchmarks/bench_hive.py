@@ -0,0 +1,134 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""
+Benchmark suite of the HiveInstance API on synthetic hive databases (see hive_generator.py) of several scales.
+Timings are saved as JSON, and compared with those of a previous run if --compare is given:
+
+    python src/test/benchmarks/bench_hive.py --scales small,medium --output bench-3.0.0.json
+    python src/test/benchmarks/bench_hive.py --scales small,medium --compare bench-3.0.0.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import pathlib
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+import timeit
+
+import sqlalchemy
+
+from ensembl.production.core.models.hive import HiveInstance
+from hive_generator import generate_hive
+
+here = pathlib.Path(__file__).parent.resolve()
+VERSION = (here.parents[2] / 'VERSION').read_text(encoding='utf-8').strip()
+
+# generate_hive arguments of each scale
+SCALES = {
+    'small': dict(trees=100, fan_out=10),
+    'medium': dict(trees=1000, fan_out=100),
+    'large': dict(trees=10000, fan_out=100),
+    'deep': dict(trees=100, fan_out=10, depth=3, semaphores=False),
+    'extended': dict(trees=1000, fan_out=10, extended_ratio=1.0, extended_size=100000),
+}
+
+
+def benchmarks(hive, description):
+    """Map each benchmark name to a function taking no argument"""
+    complete_roots = itertools.cycle(description['complete_roots'] or description['pending_roots'])
+    pending_roots = itertools.cycle(description['pending_roots'] or description['complete_roots'])
+    pending_root = next(pending_roots)
+    pending_job = hive.get_job_by_id(pending_root)
+    new_jobs = itertools.count()
+    return {
+        'get_result_for_job_id (complete)': lambda: hive.get_result_for_job_id(next(complete_roots)),
+        'get_result_for_job_id (pending)': lambda: hive.get_result_for_job_id(next(pending_roots)),
+        'get_all_results': lambda: hive.get_all_results('TestFactory'),
+        'get_all_jobs_progress': lambda: hive.get_all_jobs_progress(pending_root),
+        'get_job_tree_status': lambda: hive.get_job_tree_status(pending_job),
+        'create_job': lambda: hive.create_job('TestRunnable', {'n': next(new_jobs)}),
+    }
+
+
+def run_scale(name, repeat, tmp_dir):
+    db_path = pathlib.Path(tmp_dir) / f"bench_{name}.db"
+    start = time.perf_counter()
+    description = generate_hive(db_path, **SCALES[name])
+    generated = time.perf_counter() - start
+    hive = HiveInstance(f"sqlite:///{db_path}")
+    results = {'jobs': description['jobs'], 'shape': SCALES[name], 'generate_s': round(generated, 3),
+               'benchmarks': {}}
+    for bench_name, func in benchmarks(hive, description).items():
+        # first call warms up the analysis cache and the sqlite page cache
+        func()
+        timings = timeit.repeat(func, number=1, repeat=repeat)
+        results['benchmarks'][bench_name] = {'min_ms': round(min(timings) * 1000, 3),
+                                             'median_ms': round(statistics.median(timings) * 1000, 3),
+                                             'repeat': repeat}
+        print(f"{name:>8} {bench_name:>34}: {min(timings) * 1000:10.2f} ms min, "
+              f"{statistics.median(timings) * 1000:10.2f} ms median")
+    hive.engine.dispose()
+    db_path.unlink()
+    return results
+
+
+def compare(results, previous):
+    """Print the ratio of each median timing to the one of the previous run"""
+    print(f"Compared with {previous['version']} ({previous['date']}), ratio of median timings:")
+    for scale, scale_results in results['scales'].items():
+        previous_benchmarks = previous['scales'].get(scale, {}).get('benchmarks', {})
+        for bench_name, timing in scale_results['benchmarks'].items():
+            if bench_name in previous_benchmarks:
+                ratio = timing['median_ms'] / previous_benchmarks[bench_name]['median_ms']
+                flag = '  <-- slower' if ratio > 1.2 else ''
+                print(f"{scale:>8} {bench_name:>34}: {ratio:6.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='small,medium',
+                        help=f"comma separated, among {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--compare', help="JSON file of a previous run")
+    args = parser.parse_args()
+    scales = args.scales.split(',')
+    unknown = set(scales) - set(SCALES)
+    if unknown:
+        parser.error(f"Unknown scales: {', '.join(sorted(unknown))}")
+    results = {
+        'version': VERSION,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'scales': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            results['scales'][scale] = run_scale(scale, args.repeat, tmp_dir)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
+
+
+if __name__ == '__main__':
+    main()
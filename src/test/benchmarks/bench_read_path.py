@@ -0,0 +1,70 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""
+Micro-benchmark of the HiveInstance read paths: full ORM Job objects against JobStatus rows.
+A factory job with --children children is added to a copy of the test pipeline, then its children
+statuses are read --repeat times through each path.
+
+    python src/test/benchmarks/bench_read_path.py --children 5000 --repeat 50
+"""
+
+import argparse
+import pathlib
+import sqlite3
+import tempfile
+import timeit
+from shutil import copy2
+
+from ensembl.production.core.models.hive import HiveInstance, Job
+
+here = pathlib.Path(__file__).parent.resolve()
+DB_TEMPLATE = here.parent / "test_pipeline.db.template"
+
+
+def make_database(path, children):
+    copy2(DB_TEMPLATE, path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("INSERT INTO job (job_id, analysis_id, input_id, status) "
+                           "VALUES (100, 1, '{}', 'DONE')")
+        connection.executemany(
+            "INSERT INTO job (prev_job_id, analysis_id, input_id, status) VALUES (100, 2, ?, 'DONE')",
+            [(f'{{"n" => {i}}}',) for i in range(children)])
+
+
+def orm_children(hive):
+    with hive.Session() as session:
+        return [(job.job_id, job.status) for job in session.query(Job).filter(Job.prev_job_id == 100).all()]
+
+
+def core_children(hive):
+    return [(job.job_id, job.status) for job in hive.get_job_children_status(100)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--children', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = pathlib.Path(tmp_dir) / "bench_pipeline.db"
+        make_database(db_path, args.children)
+        hive = HiveInstance(f"sqlite:///{db_path}")
+        assert sorted(orm_children(hive)) == sorted(core_children(hive))
+        for name, func in (('orm', orm_children), ('core', core_children)):
+            elapsed = min(timeit.repeat(lambda: func(hive), number=1, repeat=args.repeat))
+            print(f"{name:>5}: {elapsed * 1000:8.2f} ms for {args.children} children "
+                  f"({elapsed / args.children * 1e6:.2f} us/row)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""
+Micro-benchmark of the CPU time spent per polling call: the hot queries built through session.query() on
+each call against the statements HiveInstance builds once. A polling round reads a job, its first child,
+the semaphore it depends on and its last log message, --polls times over the jobs of the test pipeline.
+
+    python src/test/benchmarks/bench_statement_cache.py --polls 2000
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+from shutil import copy2
+
+from sqlalchemy.orm import joinedload
+
+from ensembl.production.core.models.hive import HiveInstance, Job, LogMessage, Semaphore
+
+here = pathlib.Path(__file__).parent.resolve()
+DB_TEMPLATE = here.parent / "test_pipeline.db.template"
+
+
+def query_poll(hive, session, job_id):
+    job = session.query(Job).options(joinedload(Job.result)).filter(Job.job_id == job_id).first()
+    session.query(Job).filter(Job.prev_job_id == job.job_id).first()
+    session.query(Semaphore).filter(Semaphore.dependent_job_id == job_id).first()
+    session.query(LogMessage).filter(LogMessage.job_id == job_id) \
+        .order_by(LogMessage.log_message_id.desc()).first()
+
+
+def statement_poll(hive, session, job_id):
+    job = hive._get_job_by_id(job_id, session)
+    hive._get_job_child(job, session)
+    hive._get_semaphore_data(job_id, session)
+    hive._get_last_log_message(job_id, session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--polls', type=int, default=2000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = pathlib.Path(tmp_dir) / "bench_pipeline.db"
+        copy2(DB_TEMPLATE, db_path)
+        for name, poll in (('session.query', query_poll), ('statements', statement_poll)):
+            hive = HiveInstance(f"sqlite:///{db_path}")
+            with hive.Session() as session:
+                # warm up the statement cache and the identity map
+                for job_id in range(1, 21):
+                    poll(hive, session, job_id)
+                start = time.process_time()
+                for i in range(args.polls):
+                    poll(hive, session, i % 20 + 1)
+                elapsed = time.process_time() - start
+            stats = hive.statement_cache_stats()
+            print(f"{name:>14}: {elapsed / args.polls * 1e6:8.1f} us CPU per poll, "
+                  f"statement cache hit rate {stats['hit_rate']:.3f} ({stats['misses']} compiled)")
+            hive.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
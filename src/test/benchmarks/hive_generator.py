@@ -0,0 +1,215 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""
+Generator of synthetic SQLite hive databases, with the schema and analyses of the test pipeline.
+Each job tree has a TestFactory root job with fan_out TestRunnableParallel children, each of them having
+fan_out TestRunnableDecorate children and so on, down to depth levels. With semaphores on, the first child
+of each root is a TestRunnableMerge funnel job, blocked by a semaphore counting the unfinished jobs below
+the root.
+
+A tree has (1 + fan_out + ... + fan_out ** depth) jobs, plus its funnel: 10000 trees with a fan_out of 100
+make just over a million jobs.
+
+    python src/test/benchmarks/hive_generator.py /tmp/hive.db --trees 10000 --fan-out 100 --pending-ratio 0.1
+"""
+
+import argparse
+import json
+import logging
+import random
+import sqlite3
+from itertools import count, islice
+from shutil import copy2
+
+import pathlib
+
+here = pathlib.Path(__file__).parent.resolve()
+DB_TEMPLATE = here.parent / "test_pipeline.db.template"
+
+# analysis_id of the test pipeline analyses
+FACTORY, PARALLEL, DECORATE, MERGE = 1, 2, 3, 4
+
+TABLES = ('job', 'semaphore', 'result', 'log_message', 'analysis_data', 'job_progress', 'accu', 'job_file')
+
+logger = logging.getLogger(__name__)
+
+
+class _Builder:
+    """Accumulate the rows of the generated tables, flushing them every batch_size jobs"""
+
+    def __init__(self, connection, batch_size):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rows = {'job': [], 'semaphore': [], 'result': [], 'log_message': [], 'analysis_data': []}
+        self.job_count = 0
+
+    def job(self, *row):
+        self.rows['job'].append(row)
+        self.job_count += 1
+        if len(self.rows['job']) >= self.batch_size:
+            self.flush()
+
+    def add(self, table, *row):
+        self.rows[table].append(row)
+
+    def flush(self):
+        statements = {
+            'job': "INSERT INTO job (job_id, prev_job_id, analysis_id, input_id, param_id_stack, "
+                   "accu_id_stack, status, when_completed, controlled_semaphore_id) "
+                   "VALUES (?, ?, ?, ?, ?, '', ?, ?, ?)",
+            'semaphore': "INSERT INTO semaphore (semaphore_id, local_jobs_counter, remote_jobs_counter, "
+                         "dependent_job_id) VALUES (?, ?, 0, ?)",
+            'result': "INSERT INTO result (job_id, output) VALUES (?, ?)",
+            'log_message': "INSERT INTO log_message (job_id, msg, message_class, status) "
+                           "VALUES (?, ?, 'WORKER_ERROR', 'COMPILATION')",
+            'analysis_data': "INSERT INTO analysis_data (analysis_data_id, md5sum, data) VALUES (?, ?, ?)",
+        }
+        for table, rows in self.rows.items():
+            if rows:
+                self.connection.executemany(statements[table], rows)
+                rows.clear()
+
+
+def generate_hive(path, trees=100, fan_out=10, depth=1, semaphores=True, pending_ratio=0.1, failed_ratio=0.05,
+                  extended_ratio=0.0, extended_size=10000, seed=0, batch_size=50000):
+    """
+    Write a hive database at path, return a dict describing it, e.g. the ids of complete and pending roots
+
+    trees          -- number of job trees
+    fan_out        -- number of children of each job above depth
+    depth          -- number of levels below the root jobs
+    semaphores     -- add a semaphored funnel job to each tree
+    pending_ratio  -- fraction of the trees still running: some of their children are READY, RUN or FAILED
+    failed_ratio   -- fraction of the unfinished jobs of running trees which failed, each with a log message
+    extended_ratio -- fraction of the root jobs whose input is stored in analysis_data
+    extended_size  -- approximate length of these inputs
+    """
+    rng = random.Random(seed)
+    copy2(DB_TEMPLATE, path)
+    connection = sqlite3.connect(path)
+    triggers = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        connection.execute(f"DROP TRIGGER {name}")
+    for table in TABLES:
+        connection.execute(f"DELETE FROM {table}")
+    builder = _Builder(connection, batch_size)
+    next_id = count(1).__next__
+    description = {'trees': trees, 'fan_out': fan_out, 'depth': depth, 'semaphores': semaphores,
+                   'complete_roots': [], 'pending_roots': [], 'failed_jobs': 0, 'extended_inputs': 0}
+    for tree in range(trees):
+        pending = rng.random() < pending_ratio
+        root_id = next_id()
+        if rng.random() < extended_ratio:
+            analysis_data_id = description['extended_inputs'] + 1
+            payload = {'tree': tree, 'species': [f'species_{i}' for i in range(extended_size // 14)]}
+            builder.add('analysis_data', analysis_data_id, f'{analysis_data_id:032x}', _perl(payload))
+            root_input = f'_extended_data_id {analysis_data_id}'
+            description['extended_inputs'] += 1
+        else:
+            root_input = _perl({'tree': tree, 'dbname': f'species_{tree}_core_110_1'})
+        builder.job(root_id, None, FACTORY, root_input, '', 'DONE', _when(rng), None)
+        semaphore_id = None
+        funnel_id = None
+        if semaphores:
+            funnel_id = next_id()
+            semaphore_id = tree + 1
+        unfinished = 0
+        # (parent job id, level) of the jobs still to give children to
+        parents = [(root_id, 1)]
+        while parents:
+            parent_id, level = parents.pop()
+            for child in range(fan_out):
+                job_id = next_id()
+                status = 'DONE'
+                if pending and rng.random() < 0.5:
+                    if rng.random() < failed_ratio:
+                        status = 'FAILED'
+                        builder.add('log_message', job_id, f'Job {job_id} failed')
+                        description['failed_jobs'] += 1
+                    else:
+                        status = rng.choice(('READY', 'RUN'))
+                    unfinished += 1
+                builder.job(job_id, parent_id, PARALLEL if level == 1 else DECORATE,
+                            _perl({'tree': tree, 'level': level, 'child': child}), f'{root_id},{parent_id}',
+                            status, _when(rng) if status == 'DONE' else None, semaphore_id)
+                if level < depth:
+                    parents.append((job_id, level + 1))
+        if semaphores:
+            builder.job(funnel_id, root_id, MERGE, _perl({'tree': tree, 'funnel': 1}), f'{root_id},{root_id}',
+                        'SEMAPHORED' if unfinished else 'DONE', None if unfinished else _when(rng), None)
+            builder.add('semaphore', semaphore_id, unfinished, funnel_id)
+        if unfinished:
+            description['pending_roots'].append(root_id)
+        else:
+            description['complete_roots'].append(root_id)
+            builder.add('result', root_id, json.dumps({'tree': tree, 'output': 'complete'}))
+    builder.flush()
+    connection.execute("""
+        UPDATE analysis_stats SET
+            total_job_count = (SELECT COUNT(*) FROM job j WHERE j.analysis_id = analysis_stats.analysis_id),
+            semaphored_job_count = (SELECT COUNT(*) FROM job j
+                                    WHERE j.analysis_id = analysis_stats.analysis_id
+                                    AND j.status = 'SEMAPHORED'),
+            ready_job_count = (SELECT COUNT(*) FROM job j WHERE j.analysis_id = analysis_stats.analysis_id
+                               AND j.status = 'READY'),
+            done_job_count = (SELECT COUNT(*) FROM job j WHERE j.analysis_id = analysis_stats.analysis_id
+                              AND j.status = 'DONE'),
+            failed_job_count = (SELECT COUNT(*) FROM job j WHERE j.analysis_id = analysis_stats.analysis_id
+                                AND j.status = 'FAILED')
+    """)
+    for sql, in triggers:
+        connection.execute(sql)
+    connection.commit()
+    connection.close()
+    description['jobs'] = builder.job_count
+    logger.info("Generated %s jobs in %s trees at %s", builder.job_count, trees, path)
+    return description
+
+
+def _perl(data):
+    """Perl hash string of a flat dict of ints, strings and lists of strings"""
+    pairs = []
+    for key, value in data.items():
+        if isinstance(value, list):
+            value = '[' + ','.join(f'"{element}"' for element in value) + ']'
+        elif isinstance(value, str):
+            value = f'"{value}"'
+        pairs.append(f'"{key}" => {value}')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _when(rng):
+    return f'2023-01-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--fan-out', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--no-semaphores', dest='semaphores', action='store_false')
+    parser.add_argument('--pending-ratio', type=float, default=0.1)
+    parser.add_argument('--failed-ratio', type=float, default=0.05)
+    parser.add_argument('--extended-ratio', type=float, default=0.0)
+    parser.add_argument('--extended-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    description = generate_hive(**vars(args))
+    print(json.dumps({key: value if not isinstance(value, list) else list(islice(value, 10))
+                      for key, value in description.items()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import time
+import unittest
+
+from ensembl.production.core.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'entries': 1, 'size': 1, 'maxsize': 2},
+                         cache.stats())
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache, "Recently used entry kept")
+        self.assertNotIn('b', cache, "Least recently used entry evicted")
+        self.assertIn('c', cache)
+
+    def test_size_eviction(self):
+        cache = LRUCache(maxsize=10, getsizeof=len)
+        cache.set('a', 'x' * 6)
+        cache.set('b', 'x' * 6)
+        self.assertNotIn('a', cache, "Entry evicted to make room")
+        cache.set('c', 'x' * 11)
+        self.assertNotIn('c', cache, "Entry larger than the cache not stored")
+        self.assertEqual(6, cache.stats()['size'])
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.05)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=None)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'), "Entry expired")
+        self.assertEqual(2, cache.get('b'), "Permanent entry kept")
+
+    def test_evict(self):
+        cache = LRUCache()
+        for i in range(5):
+            cache.set(i, i * 10)
+        self.assertEqual(2, cache.evict(lambda key, value: value >= 30))
+        self.assertEqual(3, len(cache))
+        self.assertEqual(10, cache.pop(1))
+        self.assertIsNone(cache.pop(1))
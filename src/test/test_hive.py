@@ -15,10 +15,15 @@ import os
 import unittest
 import pathlib
 import sys
+import threading
+import time
 from shutil import copy2
 
+from sqlalchemy import event, text
+
+from ensembl.production.core.cache import LRUCache
 from ensembl.production.core.config import parse_debug_var
-from ensembl.production.core.models.hive import HiveInstance
+from ensembl.production.core.models.hive import HiveInstance, HiveRegistry, JobStatus
 
 
 here = pathlib.Path(__file__).parent.resolve()
@@ -38,6 +43,21 @@ DB_TEMPLATE_FILENAME = "test_pipeline.db.template"
 DB_FILENAME = "test_pipeline.db.sqlite3"
 
 
+def count_queries(engine, func, *args, **kwargs):
+    """Return the number of SQL statements issued on engine while calling func"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func(*args, **kwargs)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+
 class HiveTest(unittest.TestCase):
     """Create fresh database file"""
 
@@ -62,6 +82,43 @@ class HiveTest(unittest.TestCase):
         self.assertEqual(job1.analysis.logic_name, job2.analysis.logic_name)
         self.assertEqual(job1.input_id, job2.input_id)
 
+    def test_create_jobs(self):
+        """Test case for creating jobs in bulk from a generator"""
+        job_ids = self.hive.create_jobs('TestRunnable', ({'n': i} for i in range(2500)), chunk_size=1000)
+        self.assertEqual(2500, len(set(job_ids)), "Checking one job created per input")
+        for i in (0, 1500, 2499):
+            result = self.hive.get_result_for_job_id(job_ids[i], progress=False)
+            self.assertEqual(i, result['input']['n'], "Checking job ids returned in input order")
+            self.assertEqual('submitted', result['status'])
+        self.assertRaises(ValueError, self.hive.create_jobs, 'NotAnAnalysis', [{'n': 1}])
+        # inputs too long for the input_id column are rejected, along with the whole batch
+        inputs = [{'n': 'a'}, {'n': 'b'}, {'n': 'x' * 300}]
+        self.assertRaises(ValueError, self.hive.create_jobs, 'TestRunnable', inputs, chunk_size=2)
+        self.assertEqual(2520, len(self.hive.get_jobs_status(range(1, 3000))), "Checking no job created")
+
+    def test_analysis_cache(self):
+        """Test case for looking up analyses from the cached analysis_base table"""
+        self.assertEqual(5, self.hive.get_analysis_id('TestRunnable'))
+        self.assertEqual('TestFactory', self.hive.get_analysis_name(1))
+        self.assertEqual(5, len(self.hive.analysis_dict))
+        self.assertEqual(0, count_queries(self.hive.engine, self.hive.get_analysis_by_name, 'TestRunnable'))
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("INSERT INTO analysis_base (analysis_id, logic_name, module, "
+                                    "resource_class_id) VALUES (6, 'TestNew', 'TestNew', 1)"))
+        self.assertEqual(6, self.hive.get_analysis_id('TestNew'), "Checking cache refreshed on miss")
+        self.assertIsNone(self.hive.get_analysis_by_name('NotAnAnalysis'))
+        self.assertEqual([], self.hive.get_all_results('NotAnAnalysis'))
+
+    def test_get_job_status(self):
+        """Test case for reading job statuses without ORM objects"""
+        self.assertEqual(JobStatus(11, 7, 2, 'FAILED'), self.hive.get_job_status(11))
+        self.assertRaises(ValueError, self.hive.get_job_status, 99)
+        self.assertEqual([8, 9, 10, 11], [job.job_id for job in self.hive.get_job_children_status(7)])
+        statuses = self.hive.get_jobs_status([1, 8, 99])
+        self.assertEqual({1: 'DONE', 8: 'SEMAPHORED'},
+                         {job_id: job.status for job_id, job in statuses.items()})
+        self.assertEqual('failed', self.hive.get_job_tree_status(statuses[1]._replace(status='FAILED')))
+
     def test_check_semaphore_success(self):
         """Test case for checking on a finished semaphore"""
         semaphore_data = self.hive.get_semaphore_data(2)
@@ -107,6 +164,78 @@ class HiveTest(unittest.TestCase):
         status = self.hive.get_job_tree_status(job)
         self.assertEqual("incomplete", status, "Checking status of incomplete job factory")
 
+    def test_check_job_tree_cte_matches_recursive(self):
+        """Test case for the recursive query walk matching the python walk on every job"""
+        fallback = HiveInstance(f"sqlite:///{here/DB_FILENAME}", use_cte=False)
+        for job_id in range(1, 21):
+            job = self.hive.get_job_by_id(job_id)
+            self.assertEqual(fallback.get_job_tree_status(job), self.hive.get_job_tree_status(job),
+                             f"Checking tree status of job {job_id}")
+
+    def test_check_job_tree_pending_semaphore(self):
+        """Test case for checking on a job factory with a pending semaphore"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1 WHERE semaphore_id = 1"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 1 WHERE job_id IN (9, 10, 11)"))
+        job = self.hive.get_job_by_id(7)
+        self.assertEqual("failed", self.hive.get_job_tree_status(job), "Checking pending semaphore status")
+        fallback = HiveInstance(f"sqlite:///{here/DB_FILENAME}", use_cte=False)
+        self.assertEqual("failed", fallback.get_job_tree_status(job), "Checking pending semaphore status")
+
+    def test_get_semaphores_status(self):
+        """Test case for resolving the semaphores holding many jobs at once"""
+        jobs = list(self.hive.get_jobs_status(range(1, 21)).values())
+        self.assertEqual({}, self.hive.get_semaphores_status(jobs), "Checking no pending semaphore")
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 1 WHERE job_id IN (9, 10, 11)"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 2 WHERE job_id IN (3, 4)"))
+        self.assertEqual({1: 'complete', 7: 'failed'}, self.hive.get_semaphores_status(jobs))
+        self.assertEqual(2, count_queries(self.hive.engine, self.hive.get_semaphores_status, jobs))
+
+    def test_job_tree_statuses_by_level(self):
+        """Test case for the level by level walk of many job trees matching the recursive query walk"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1 WHERE semaphore_id = 2"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 2 WHERE job_id IN (3, 4)"))
+        fallback = HiveInstance(f"sqlite:///{here/DB_FILENAME}", use_cte=False)
+        for analysis in ('TestFactory', 'TestRunnableParallel', 'TestRunnableMerge'):
+            self.assertEqual(self.hive.get_all_results(analysis, bulk=False),
+                             fallback.get_all_results(analysis),
+                             f"Checking level walk statuses for {analysis}")
+
+    def test_job_tree_semaphore_below_unfinished_job(self):
+        """Test case for the semaphore of the first child of an unfinished job being checked by every walk"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET status = 'RUN' WHERE job_id = 16"))
+            connection.execute(text("UPDATE job SET status = 'SEMAPHORED' WHERE job_id = 18"))
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1, dependent_job_id = 18 "
+                                    "WHERE semaphore_id = 2"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 2, status = 'FAILED' "
+                                    "WHERE job_id = 20"))
+        with self.hive.Session() as session:
+            job = self.hive._get_job_by_id(14, session)
+            statuses = (self.hive._get_job_tree_status_recursive(job, session),
+                        self.hive._get_job_tree_statuses_cte([job], session)[14],
+                        self.hive._get_job_tree_statuses_by_level([job], session)[14])
+        self.assertEqual(('failed', 'failed', 'failed'), statuses)
+        fallback = HiveInstance(f"sqlite:///{here/DB_FILENAME}", use_cte=False)
+        self.assertEqual(self.hive.get_all_results('TestFactory', bulk=False),
+                         fallback.get_all_results('TestFactory'))
+
+    def test_wait_for_jobs_semaphore_below_unfinished_job(self):
+        """Test case for waiting for an unfinished job whose first child waits for a failed semaphore"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET status = 'RUN' WHERE job_id = 14"))
+            connection.execute(text("UPDATE job SET status = 'SEMAPHORED' WHERE job_id = 15"))
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1, dependent_job_id = 15 "
+                                    "WHERE semaphore_id = 2"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 2, status = 'FAILED' "
+                                    "WHERE job_id = 20"))
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", poll_interval=0.01, max_poll_interval=0.05)
+        self.assertEqual({14: 'failed'}, hive.wait_for_jobs([14], timeout=5))
+        self.assertEqual('failed', hive.watch_jobs([14])[14].result(timeout=5))
+
     def test_get_job_output_success(self):
         """Test case for getting output on a completed job factory"""
         output = self.hive.get_result_for_job_id(1)
@@ -121,11 +250,240 @@ class HiveTest(unittest.TestCase):
         self.assertEqual('incomplete', output['status'], "Checking status of incomplete job factory output")
         self.assertTrue('output' not in output, "Checking output of incomplete job factory output")
 
+    def test_result_cache(self):
+        """Test case for caching complete results permanently and other results briefly"""
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", result_cache=LRUCache(), result_ttl=60)
+        output = hive.get_result_for_job_id(1)
+        self.assertEqual(0, count_queries(hive.engine, hive.get_result_for_job_id, 1),
+                         "Complete result cached")
+        output['status'] = 'changed'
+        self.assertEqual('complete', hive.get_result_for_job_id(1)['status'], "Cached result not shared")
+        hive.get_result_for_job_id(7)
+        self.assertEqual(0, count_queries(hive.engine, hive.get_result_for_job_id, 7),
+                         "Incomplete result cached")
+        hive.result_ttl = 0
+        hive.result_cache.pop((7, False, True, None))
+        hive.get_result_for_job_id(7)
+        self.assertNotEqual(0, count_queries(hive.engine, hive.get_result_for_job_id, 7),
+                            "Incomplete result expired")
+        self.assertEqual(3, hive.result_cache_stats()['hits'])
+
+    def test_result_cache_complete_without_output(self):
+        """Test case for not caching permanently a tree complete before its job result is written"""
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", result_cache=LRUCache(), result_ttl=0)
+        with hive.engine.begin() as connection:
+            output = connection.execute(text("SELECT output FROM result WHERE job_id = 14")).scalar()
+            connection.execute(text("DELETE FROM result WHERE job_id = 14"))
+        result = hive.get_result_for_job_id(14)
+        self.assertEqual('complete', result['status'], "Checking tree complete")
+        self.assertNotIn('output', result)
+        with hive.engine.begin() as connection:
+            connection.execute(text("INSERT INTO result (job_id, output) VALUES (14, :output)"),
+                               {'output': output})
+        self.assertIn('output', hive.get_result_for_job_id(14), "Checking result not cached permanently")
+        self.assertEqual(0, count_queries(hive.engine, hive.get_result_for_job_id, 14), "Final result cached")
+
+    def test_result_cache_delete(self):
+        """Test case for dropping cached results of deleted jobs"""
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", result_cache=LRUCache())
+        job = hive.create_job('TestRunnable', {'x': 'y', 'a': 'b'})
+        hive.get_result_for_job_id(job.job_id)
+        hive.get_result_for_job_id(1)
+        hive.delete_job_by_id(job.job_id)
+        self.assertRaises(ValueError, hive.get_result_for_job_id, job.job_id)
+        self.assertEqual(1, len(hive.result_cache), "Only the deleted job result dropped")
+
+    def test_analysis_data_input_cache(self):
+        """Test case for resolving extended inputs in one query, then from the cache"""
+        with self.hive.engine.begin() as connection:
+            for analysis_data_id in (1, 2):
+                connection.execute(text("INSERT INTO analysis_data (analysis_data_id, md5sum, data) VALUES "
+                                        f"({analysis_data_id}, 'md5', '{{\"n\" => {analysis_data_id}}}')"))
+            connection.execute(text("INSERT INTO job (job_id, analysis_id, input_id, status) "
+                                    "VALUES (21, 5, '_extended_data_id 2', 'READY')"))
+        self.assertEqual(1, count_queries(self.hive.engine, self.hive.get_analysis_data_inputs, [1, 2, 3]))
+        inputs = self.hive.get_analysis_data_inputs([1, 2, 3])
+        self.assertEqual({1: {'n': 1}, 2: {'n': 2}}, inputs, "Checking missing ids left out")
+        inputs[1]['n'] = 'changed'
+        self.assertEqual({'n': 1}, self.hive.get_analysis_data_inputs([1])[1], "Cached input not shared")
+        self.assertEqual({'n': 2}, self.hive.get_result_for_job_id(21)['input'], "Checking extended input")
+        self.assertEqual(4, self.hive.input_cache_stats()['hits'])
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", input_cache_size=0)
+        self.assertEqual({'n': 2}, hive.get_result_for_job_id(21)['input'],
+                         "Checking uncached extended input")
+        self.assertIsNone(hive.input_cache_stats())
+
+    def test_check_indexes(self):
+        """Test case for reporting, then creating, the missing hot path indexes"""
+        with self.assertLogs('ensembl.production.core.models.hive', level='WARNING'):
+            checks = {(check.table, check.column): check for check in self.hive.check_indexes()}
+        self.assertEqual(6, len(checks))
+        self.assertIsNone(checks[('job', 'prev_job_id')].index)
+        self.assertEqual(20, checks[('job', 'prev_job_id')].rows, "Checking full scan estimate")
+        self.assertEqual('unique_dependent_job_id', checks[('semaphore', 'dependent_job_id')].index)
+        created = [check.column for check in self.hive.check_indexes(create_missing=True) if check.created]
+        self.assertEqual(['prev_job_id', 'param_id_stack', 'controlled_semaphore_id'], created)
+        checks = {(check.table, check.column): check for check in self.hive.check_indexes()}
+        self.assertEqual('job_prev_job_id_idx', checks[('job', 'prev_job_id')].index)
+        self.assertIn('USING INDEX job_prev_job_id_idx', checks[('job', 'prev_job_id')].plan)
+        self.assertIsNone(checks[('job', 'prev_job_id')].rows)
+
+    def test_wait_for_jobs(self):
+        """Test case for waiting for job trees to end"""
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", poll_interval=0.01, max_poll_interval=0.05)
+        self.assertEqual({1: 'complete', 11: 'failed'}, hive.wait_for_jobs([1, 11], timeout=5))
+        job = hive.create_job('TestRunnable', {'x': 'y'})
+        self.assertEqual({job.job_id: 'submitted'}, hive.wait_for_jobs([job.job_id], timeout=0.1))
+
+        def complete_job():
+            with hive.engine.begin() as connection:
+                connection.execute(text("UPDATE job SET status = 'DONE' WHERE job_id = :job_id"),
+                                   {'job_id': job.job_id})
+
+        threading.Timer(0.1, complete_job).start()
+        self.assertEqual({job.job_id: 'complete'}, hive.wait_for_jobs([job.job_id], timeout=5))
+        self.assertRaises(ValueError, hive.wait_for_jobs, [999], timeout=5)
+
+    def test_wait_for_jobs_shared_poller(self):
+        """Test case for polling the jobs of all the waiters together"""
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}", poll_interval=0.05, max_poll_interval=0.05)
+        job_ids = [hive.create_job('TestRunnable', {'n': i}).job_id for i in range(10)]
+        waiters = [threading.Thread(target=hive.wait_for_jobs, args=([job_id],), kwargs={'timeout': 0.5})
+                   for job_id in job_ids]
+
+        def wait_all():
+            for waiter in waiters:
+                waiter.start()
+            for waiter in waiters:
+                waiter.join()
+
+        statements = count_queries(hive.engine, wait_all)
+        self.assertLess(statements, 30, "Checking two queries per tick, not per waiter")
+        time.sleep(0.1)
+        self.assertIsNone(hive._waiter._thread, "Checking the poller stops when nothing is waited for")
+
+    def test_statement_cache(self):
+        """Test case for the polling queries being compiled once"""
+        hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}")
+        for job_id in (7, 14):
+            job = hive.get_job_by_id(job_id)
+            hive.get_job_status(job_id)
+            hive.get_job_child(job)
+            hive.get_semaphore_data(job_id)
+            hive.get_job_failure_msg_by_id(job_id, child=True)
+        stats = hive.statement_cache_stats()
+        self.assertEqual(5, stats['misses'], "Checking each statement compiled once")
+        self.assertEqual(9, stats['hits'])
+        self.assertEqual(8, hive.get_job_child(hive.get_job_by_id(7)).job_id, "Checking first child")
+        self.assertIsNone(hive.get_job_parent(hive.get_job_by_id(7)))
+
+    def test_get_all_jobs_progress(self):
+        """Test case for counting jobs sharing the parameters of a job"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET param_id_stack = '7,8' WHERE job_id IN (9, 10, 11, 12)"))
+            connection.execute(text("UPDATE job SET param_id_stack = '17' WHERE job_id IN (13)"))
+        progress = self.hive.get_all_jobs_progress(7)
+        self.assertEqual({'total': 4, 'inprogress': 0, 'completed': 3, 'failed': 1}, progress)
+        progress = self.hive.get_all_jobs_progress(7, analysis_id=3)
+        self.assertEqual({'total': 1, 'inprogress': 0, 'completed': 1, 'failed': 0}, progress)
+        progress = self.hive.get_all_jobs_progress(7, by_analysis=True)
+        self.assertEqual({'total': 3, 'inprogress': 0, 'completed': 2, 'failed': 1},
+                         progress['analyses']['TestRunnableParallel'])
+        self.assertEqual({'total': 1, 'inprogress': 0, 'completed': 1, 'failed': 0},
+                         progress['analyses']['TestRunnableDecorate'])
+        self.assertEqual(4, progress['total'])
+
+    def test_get_jobs_failure_msg(self):
+        """Test case for retrieving the latest failure message of a job family"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET status = 'FAILED' WHERE job_id IN (7, 10)"))
+            for job_id, msg in ((7, 'old'), (7, 'parent failed'), (11, 'child failed'), (12, 'grand child')):
+                connection.execute(text("INSERT INTO log_message (job_id, msg) VALUES (:job_id, :msg)"),
+                                   {'job_id': job_id, 'msg': msg})
+        failures = self.hive.get_jobs_failure_msg(7)
+        self.assertEqual({7: 'parent failed', 10: None, 11: 'child failed'}, failures)
+        self.assertEqual(2, count_queries(self.hive.engine, self.hive.get_jobs_failure_msg, 7))
+        messages = self.hive.get_last_log_messages([7, 11, 12, 13])
+        self.assertEqual({7: 'parent failed', 11: 'child failed', 12: 'grand child'},
+                         {job_id: message.msg for job_id, message in messages.items()})
+        self.assertRaises(ValueError, self.hive.get_jobs_failure_msg, 99)
+
+    def test_get_pipeline_summary(self):
+        """Test case for counting jobs by analysis and status"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 3 WHERE semaphore_id = 1"))
+            connection.execute(text("INSERT INTO analysis_base (analysis_id, logic_name, module, "
+                                    "resource_class_id) VALUES (6, 'TestNew', 'TestNew', 1)"))
+        summary = self.hive.get_pipeline_summary()
+        self.assertEqual({'total': 7, 'statuses': {'DONE': 6, 'FAILED': 1}, 'semaphore_backlog': 0},
+                         summary['TestRunnableParallel'])
+        self.assertEqual({'total': 3, 'statuses': {'DONE': 2, 'SEMAPHORED': 1}, 'semaphore_backlog': 3},
+                         summary['TestRunnableMerge'])
+        self.assertEqual({'total': 0, 'statuses': {}, 'semaphore_backlog': 0}, summary['TestNew'])
+        self.assertEqual(20, sum(analysis['total'] for analysis in summary.values()))
+        self.assertEqual(summary, self.hive.get_pipeline_summary(max_age=60))
+        self.hive.create_job('TestRunnable', {'x': 'y'})
+        self.assertEqual(0, count_queries(self.hive.engine, self.hive.get_pipeline_summary, max_age=60))
+        self.assertEqual(1, self.hive.get_pipeline_summary(max_age=60)['TestRunnable']['total'],
+                         "Checking cached")
+        self.assertEqual(2, self.hive.get_pipeline_summary(max_age=0)['TestRunnable']['total'],
+                         "Checking refreshed")
+
     def test_get_all_results(self):
         """Test case for listing all jobs"""
         jobs = self.hive.get_all_results('TestRunnable')
         self.assertEqual(1, len(jobs), "Checking we got just one job")
 
+    def test_get_all_results_bulk(self):
+        """Test case for the bulk listing returning the same results as the job by job listing"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("INSERT INTO analysis_data (analysis_data_id, md5sum, data) "
+                                    "VALUES (1, 'md5', '{\"date\" => \"later\", \"names\" => [\"Bob\"]}')"))
+            connection.execute(text("INSERT INTO job (job_id, analysis_id, input_id, status) "
+                                    "VALUES (21, 1, '_extended_data_id 1', 'READY')"))
+        for analysis in ('TestFactory', 'TestRunnableParallel'):
+            for child in (False, True):
+                self.assertEqual(self.hive.get_all_results(analysis, child=child, bulk=False),
+                                 self.hive.get_all_results(analysis, child=child),
+                                 f"Checking bulk results for {analysis} (child: {child})")
+        jobs = self.hive.get_all_results('TestFactory')
+        self.assertEqual({'date': 'later', 'names': ['Bob']}, jobs[-1]['input'], "Checking extended input")
+
+    def test_get_all_results_query_count(self):
+        """Test case for the bulk listing query count not growing with the number of jobs"""
+        counts = []
+        for n_jobs in (2, 20):
+            for i in range(n_jobs - len(self.hive.get_all_results('TestRunnable'))):
+                self.hive.create_job('TestRunnable', {'job': f'{n_jobs}_{i}'})
+            counts.append(count_queries(self.hive.engine, self.hive.get_all_results, 'TestRunnable',
+                                        child=True))
+        self.assertEqual(counts[0], counts[1], "Checking query count does not depend on the number of jobs")
+
+    def test_iter_results(self):
+        """Test case for streaming all jobs results page by page"""
+        for i in range(5):
+            self.hive.create_job('TestFactory', {'n': i})
+        results = self.hive.iter_results('TestFactory', child=True, batch_size=2)
+        self.assertFalse(isinstance(results, list), "Checking results are generated")
+        self.assertEqual(self.hive.get_all_results('TestFactory', child=True), list(results))
+        self.assertEqual([], list(self.hive.iter_results('NotAnAnalysis')))
+
+    def test_delete_jobs(self):
+        """Test case for deleting jobs, their children and parents in bulk"""
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("INSERT INTO log_message (job_id, msg) VALUES (11, 'failed')"))
+            connection.execute(text("INSERT INTO job_progress (job_id, message) VALUES (9, 'half way')"))
+        self.assertEqual([9, 12], self.hive.delete_jobs([9], include_parents=False))
+        self.assertEqual([1, 3, 7, 11, 14, 16], self.hive.delete_jobs([3, 11, 16], include_children=False))
+        self.assertEqual([], self.hive.delete_jobs([99]))
+        remaining = self.hive.get_jobs_status(range(1, 21))
+        self.assertEqual([2, 4, 5, 6, 8, 10, 13, 15, 17, 18, 19, 20], sorted(remaining))
+        with self.hive.engine.connect() as connection:
+            self.assertEqual(0, connection.execute(text("SELECT COUNT(*) FROM log_message")).scalar())
+            self.assertEqual(0, connection.execute(text("SELECT COUNT(*) FROM job_progress")).scalar())
+            self.assertEqual(0, connection.execute(
+                text("SELECT COUNT(*) FROM result WHERE job_id IN (1, 7, 14)")).scalar())
+
     def test_delete_job(self):
         job = self.hive.create_job('TestRunnable', {'x': 'y', 'a': 'b'})
         job_id = self.hive.get_job_by_id(job.job_id).job_id
@@ -134,5 +492,47 @@ class HiveTest(unittest.TestCase):
         self.assertRaises(ValueError, self.hive.get_job_by_id, job.job_id)
 
 
+class HiveRegistryTest(unittest.TestCase):
+    """Create two fresh database files"""
+
+    def setUp(self):
+        self.db_files = [here/f"registry_{i}_{DB_FILENAME}" for i in range(2)]
+        for db_file in self.db_files:
+            copy2(here/DB_TEMPLATE_FILENAME, db_file)
+        self.urls = [f"sqlite:///{db_file}" for db_file in self.db_files]
+
+    def tearDown(self):
+        for db_file in self.db_files:
+            os.remove(db_file)
+
+    def test_independent_instances(self):
+        """Test case for instances on different databases not sharing sessions"""
+        hive1, hive2 = (HiveInstance(url) for url in self.urls)
+        hive1.delete_job_by_id(20)
+        self.assertRaises(ValueError, hive1.get_job_by_id, 20)
+        self.assertEqual(20, hive2.get_job_by_id(20).job_id, "Checking second hive untouched")
+
+    def test_registry_map(self):
+        """Test case for querying all registered hives at once"""
+        with HiveRegistry(max_workers=2) as registry:
+            for url in self.urls:
+                registry.register(url)
+            self.assertIs(registry.get(self.urls[0]), registry.register(self.urls[0]),
+                          "Checking one hive per URL")
+            registry.get(self.urls[1]).delete_job_by_id(20)
+            results = registry.map('get_job_status', 20, return_exceptions=True)
+            self.assertEqual('DONE', results[self.urls[0]].status)
+            self.assertIsInstance(results[self.urls[1]], ValueError)
+            self.assertRaises(ValueError, registry.map, 'get_job_status', 20)
+            statuses = registry.map(
+                lambda hive, job_id: hive.get_job_tree_status(hive.get_job_status(job_id)), 7)
+            self.assertEqual({url: 'incomplete' for url in self.urls}, statuses)
+            registry.idle_timeout = 0
+            self.assertEqual(self.urls, registry.dispose_idle(), "Checking idle pools disposed of")
+            self.assertEqual(2, len(registry.map('get_analysis_id', 'TestRunnable')))
+            registry.unregister(self.urls[1])
+            self.assertEqual([self.urls[0]], registry.urls)
+
+
 if __name__ == '__main__':
     unittest.main()
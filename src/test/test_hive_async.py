@@ -0,0 +1,80 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import asyncio
+import logging
+import os
+import pathlib
+import unittest
+from shutil import copy2
+
+from ensembl.production.core.models.hive import HiveInstance
+from ensembl.production.core.models.hive_async import AsyncHiveInstance
+
+logging.basicConfig()
+
+here = pathlib.Path(__file__).parent.resolve()
+
+DB_TEMPLATE_FILENAME = "test_pipeline.db.template"
+DB_FILENAME = "test_async_pipeline.db.sqlite3"
+
+
+class AsyncHiveTest(unittest.IsolatedAsyncioTestCase):
+    """Create fresh database file"""
+
+    async def asyncSetUp(self):
+        copy2(here/DB_TEMPLATE_FILENAME, here/DB_FILENAME)
+        self.hive = AsyncHiveInstance(f"sqlite+aiosqlite:///{here/DB_FILENAME}")
+
+    async def asyncTearDown(self):
+        await self.hive.dispose()
+        os.remove(here/DB_FILENAME)
+
+    async def test_same_results(self):
+        sync_hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}")
+        for job_id in (1, 7, 8, 14):
+            self.assertEqual(sync_hive.get_result_for_job_id(job_id),
+                             await self.hive.get_result_for_job_id(job_id))
+        self.assertEqual(sync_hive.get_all_results('TestRunnableParallel', child=True),
+                         await self.hive.get_all_results('TestRunnableParallel', child=True))
+        self.assertEqual(sync_hive.get_all_jobs_progress(1, by_analysis=True),
+                         await self.hive.get_all_jobs_progress(1, by_analysis=True))
+        with self.assertRaises(ValueError):
+            await self.hive.get_result_for_job_id(999)
+
+    async def test_create_job(self):
+        job = await self.hive.create_job('TestRunnable', {'x': 'y'})
+        self.assertEqual('TestRunnable', job.analysis.logic_name)
+        result = await self.hive.get_result_for_job_id(job.job_id)
+        self.assertEqual('submitted', result['status'])
+        self.assertEqual([job.job_id], await self.hive.delete_jobs([job.job_id]))
+        with self.assertRaises(ValueError):
+            await self.hive.get_job_by_id(job.job_id)
+
+    async def test_concurrent_lookups(self):
+        statuses = await asyncio.gather(*[self.hive.get_job_status(job_id) for job_id in range(1, 21)])
+        self.assertEqual(list(range(1, 21)), [status.job_id for status in statuses])
+        context = await self.hive.get_job_context(7)
+        self.assertEqual(7, context['job'].job_id)
+        self.assertEqual(8, context['child'].job_id)
+        self.assertIsNone(context['semaphore'])
+        context = await self.hive.get_job_context(8)
+        self.assertEqual(1, context['semaphore'].semaphore_id)
+
+    async def test_pipeline_summary(self):
+        summaries = await asyncio.gather(*[self.hive.get_pipeline_summary(max_age=60) for _ in range(5)])
+        self.assertEqual(7, summaries[0]['TestRunnableParallel']['total'])
+        self.assertTrue(all(summary == summaries[0] for summary in summaries))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import os
+import pathlib
+import unittest
+from shutil import copy2
+from unittest.mock import MagicMock
+
+from sqlalchemy import text
+
+from ensembl.production.core.hive_feed import HiveChangeFeed, JobTransition
+from ensembl.production.core.models.hive import HiveInstance
+
+logging.basicConfig()
+
+here = pathlib.Path(__file__).parent.resolve()
+
+DB_TEMPLATE_FILENAME = "test_pipeline.db.template"
+DB_FILENAME = "test_feed_pipeline.db.sqlite3"
+
+
+class HiveChangeFeedTest(unittest.TestCase):
+    """Create fresh database file"""
+
+    def setUp(self):
+        copy2(here/DB_TEMPLATE_FILENAME, here/DB_FILENAME)
+        self.hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}")
+
+    def tearDown(self):
+        os.remove(here/DB_FILENAME)
+
+    def execute(self, statement, **params):
+        with self.hive.engine.begin() as connection:
+            connection.execute(text(statement), params)
+
+    def test_transitions(self):
+        feed = HiveChangeFeed(self.hive)
+        seen = []
+        feed.subscribe(seen.append)
+        self.assertEqual([], feed.poll(), "Checking first poll only records state")
+        job = self.hive.create_job('TestRunnable', {'x': 'y'})
+        self.assertEqual([JobTransition(job.job_id, 'TestRunnable', None, 'READY', None)], feed.poll())
+        self.assertEqual([], feed.poll(), "Checking nothing changed")
+        self.execute("UPDATE job SET status = 'DONE', when_completed = '2030-01-01 00:00:00' "
+                     "WHERE job_id = :job_id", job_id=job.job_id)
+        self.assertEqual([JobTransition(job.job_id, 'TestRunnable', 'READY', 'DONE', '2030-01-01 00:00:00')],
+                         feed.poll())
+        self.execute("UPDATE job SET status = 'FAILED' WHERE job_id = 8")
+        self.execute("INSERT INTO log_message (job_id, msg) VALUES (8, 'failed')")
+        self.execute("INSERT INTO log_message (job_id, msg) VALUES (9, 'no change')")
+        self.assertEqual([JobTransition(8, 'TestRunnableMerge', 'SEMAPHORED', 'FAILED', None)], feed.poll())
+        self.assertEqual([], feed.poll())
+        self.assertEqual(3, len(seen), "Checking subscriber notified")
+
+    def test_from_start(self):
+        feed = HiveChangeFeed(self.hive, from_start=True)
+        transitions = feed.poll()
+        self.assertEqual(20, len(transitions), "Checking all jobs reported")
+        self.assertTrue(all(transition.previous_status is None for transition in transitions))
+        self.assertEqual([], feed.poll())
+
+    def test_publish(self):
+        publisher = MagicMock()
+        feed = HiveChangeFeed(self.hive, publisher=publisher, routing_key='hive.jobs')
+        feed.poll()
+        job = self.hive.create_job('TestRunnable', {'x': 'y'})
+        feed.poll()
+        producer = publisher.acquire_producer.return_value.__enter__.return_value
+        producer.publish.assert_called_once_with(
+            {'job_id': job.job_id, 'analysis': 'TestRunnable', 'previous_status': None, 'status': 'READY',
+             'when_completed': None}, 'hive.jobs')
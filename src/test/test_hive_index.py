@@ -0,0 +1,98 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import os
+import pathlib
+import unittest
+from shutil import copy2
+
+from sqlalchemy import text
+
+from ensembl.production.core.hive_index import HiveJobIndex
+from ensembl.production.core.models.hive import HiveInstance
+
+logging.basicConfig()
+
+here = pathlib.Path(__file__).parent.resolve()
+
+DB_TEMPLATE_FILENAME = "test_pipeline.db.template"
+DB_FILENAME = "test_index_pipeline.db.sqlite3"
+INDEX_FILENAME = "test_index.db.sqlite3"
+
+
+class HiveJobIndexTest(unittest.TestCase):
+    """Create fresh database file"""
+
+    def setUp(self):
+        copy2(here/DB_TEMPLATE_FILENAME, here/DB_FILENAME)
+        self.hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}")
+
+    def tearDown(self):
+        os.remove(here/DB_FILENAME)
+        if os.path.exists(here/INDEX_FILENAME):
+            os.remove(here/INDEX_FILENAME)
+
+    def test_find_jobs(self):
+        index = HiveJobIndex(self.hive, keys=('name', 'names', 'date'))
+        self.assertEqual([5, 12, 18], index.find_jobs(name='Dan', analysis='TestRunnableDecorate'))
+        self.assertEqual([7, 8, 11], index.find_jobs(names='Bob') + index.find_jobs(name='Bob'))
+        self.assertEqual([7], index.find_jobs(names='Bob', date='today'), "Checking all criteria must match")
+        self.assertEqual(20, index.max_job_id)
+        self.assertRaises(ValueError, index.find_jobs, dbname='homo_sapiens_core_110_38')
+        self.assertRaises(ValueError, index.find_jobs, name='Dan', analysis='Unknown')
+
+    def test_incremental(self):
+        index = HiveJobIndex(self.hive)
+        self.assertEqual([], index.find_jobs(dbname='homo_sapiens_core_110_38'))
+        job = self.hive.create_job('TestRunnable',
+                                   {'dbname': 'homo_sapiens_core_110_38', 'species': ['homo_sapiens']})
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("INSERT INTO analysis_data (analysis_data_id, md5sum, data) "
+                                    "VALUES (1, 'md5', '{\"dbname\" => \"homo_sapiens_core_110_38\"}')"))
+            connection.execute(text("INSERT INTO job (job_id, analysis_id, input_id, status) "
+                                    "VALUES (30, 5, '_extended_data_id 1', 'READY')"))
+        self.assertEqual(2, index.refresh(), "Checking only new jobs are indexed")
+        self.assertEqual([job.job_id, 30], index.find_jobs(dbname='homo_sapiens_core_110_38'))
+        self.assertEqual([job.job_id], index.find_jobs(species='homo_sapiens', refresh=False))
+        self.hive.delete_job_by_id(30)
+        self.assertEqual([job.job_id], index.find_jobs(dbname='homo_sapiens_core_110_38'),
+                         "Deleted job dropped")
+
+    def test_out_of_order(self):
+        with self.hive.engine.begin() as connection:
+            jobs = connection.execute(text("SELECT job_id, analysis_id, input_id, status FROM job "
+                                           "WHERE job_id IN (12, 18)")).mappings().all()
+            connection.execute(text("DELETE FROM job WHERE job_id IN (12, 18)"))
+        index = HiveJobIndex(self.hive, keys=('name',), rescan_window=5)
+        self.assertEqual([5], index.find_jobs(name='Dan', analysis='TestRunnableDecorate'))
+        # jobs 12 and 18 committed after job 20, only job 18 is within the window below the watermark
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("INSERT INTO job (job_id, analysis_id, input_id, status) "
+                                    "VALUES (:job_id, :analysis_id, :input_id, :status)"),
+                               [dict(job) for job in jobs])
+        self.assertEqual(1, index.refresh(), "Checking the job committed late is indexed")
+        self.assertEqual(0, index.refresh(), "Checking it is indexed once")
+        self.assertEqual([5, 18], index.find_jobs(name='Dan', analysis='TestRunnableDecorate'))
+
+    def test_persistent(self):
+        with HiveJobIndex(self.hive, path=str(here/INDEX_FILENAME)) as index:
+            index.refresh()
+        with HiveJobIndex(self.hive, path=str(here/INDEX_FILENAME)) as index:
+            self.assertEqual(20, index.max_job_id, "Checking watermark kept")
+        with HiveJobIndex(self.hive, keys=('name',), path=str(here/INDEX_FILENAME)) as index:
+            self.assertEqual(0, index.max_job_id, "Checking index rebuilt for other keys")
+            self.assertEqual([20], index.find_jobs(name='Dave'))
+
+
+if __name__ == '__main__':
+    unittest.main()
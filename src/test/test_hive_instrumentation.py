@@ -0,0 +1,99 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import os
+import pathlib
+import unittest
+from shutil import copy2
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from ensembl.production.core.hive_feed import HiveChangeFeed
+from ensembl.production.core.hive_instrumentation import (HiveInstrumentation, QueryBudgetExceeded,
+                                                          UNATTRIBUTED)
+from ensembl.production.core.models.hive import HiveInstance
+
+logging.basicConfig()
+
+here = pathlib.Path(__file__).parent.resolve()
+
+DB_TEMPLATE_FILENAME = "test_pipeline.db.template"
+DB_FILENAME = "test_instrumentation_pipeline.db.sqlite3"
+
+
+class HiveInstrumentationTest(unittest.TestCase):
+    """Create fresh database file"""
+
+    def setUp(self):
+        copy2(here/DB_TEMPLATE_FILENAME, here/DB_FILENAME)
+        self.hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}")
+        self.instrumentation = HiveInstrumentation(self.hive)
+
+    def tearDown(self):
+        self.instrumentation.uninstall()
+        os.remove(here/DB_FILENAME)
+
+    def test_snapshot(self):
+        self.hive.get_job_status(1)
+        self.hive.get_job_status(2)
+        self.hive.create_job('TestRunnable', {'x': 'y'})
+        results = list(self.hive.iter_results('TestRunnableParallel', batch_size=2))
+        HiveChangeFeed(self.hive).poll()
+        snapshot = self.instrumentation.snapshot(reset=True)
+        self.assertEqual({'calls': 2, 'statements': 2, 'max_statements': 1, 'rows': 0},
+                         {key: value for key, value in snapshot['get_job_status'].items()
+                          if 'time' not in key})
+        self.assertEqual(1, snapshot['create_job']['calls'], "Checking nested public calls are not counted")
+        self.assertEqual(1, snapshot['create_job']['rows'], "Checking inserted rows")
+        self.assertEqual(7, len(results))
+        self.assertEqual(1, snapshot['iter_results']['calls'])
+        self.assertGreater(snapshot['iter_results']['statements'], 4,
+                           "Checking generator statements attributed")
+        self.assertIn(UNATTRIBUTED, snapshot)
+        self.assertEqual({}, self.instrumentation.snapshot(), "Checking counters reset")
+
+    def test_query_budget(self):
+        with self.instrumentation.query_budget(get_job_status=1, get_all_results=5):
+            self.hive.get_job_status(1)
+            self.hive.get_all_results('TestRunnableParallel', child=True)
+        with self.assertRaises(QueryBudgetExceeded):
+            with self.instrumentation.query_budget(get_all_results=5):
+                self.hive.get_all_results('TestRunnableParallel', child=True, bulk=False)
+        self.assertRaises(ValueError, self.instrumentation.query_budget(_get_job_status=1).__enter__)
+
+    def test_failed_statement(self):
+        with self.hive.engine.connect() as connection:
+            for _attempt in range(3):
+                self.assertRaises(OperationalError, connection.execute, text("SELECT * FROM missing_table"))
+            connection.execute(text("SELECT 1"))
+            self.assertNotIn('hive_instrumentation_start', connection.info,
+                             "Checking no start time left behind")
+        self.assertEqual(1, self.instrumentation.snapshot()[UNATTRIBUTED]['statements'])
+
+    def test_log(self):
+        self.hive.get_job_status(1)
+        with self.assertLogs('ensembl.production.core.hive_instrumentation', level='INFO') as logs:
+            self.instrumentation.log()
+        self.assertIn('get_job_status: 1 calls, 1 statements', logs.output[0])
+
+    def test_uninstall(self):
+        self.instrumentation.uninstall()
+        self.hive.get_job_status(1)
+        self.assertEqual({}, self.instrumentation.snapshot())
+        self.assertNotIn('get_job_status', vars(self.hive))
+        self.instrumentation = HiveInstrumentation(self.hive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#    See the NOTICE file distributed with this work for additional information
+#    regarding copyright ownership.
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#        http://www.apache.org/licenses/LICENSE-2.0
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import os
+import pathlib
+import tempfile
+import unittest
+from shutil import copy2
+
+from sqlalchemy import text
+
+from ensembl.production.core.hive_snapshot import HiveSnapshot, export_snapshot
+from ensembl.production.core.models.hive import HiveInstance
+
+logging.basicConfig()
+
+here = pathlib.Path(__file__).parent.resolve()
+
+DB_TEMPLATE_FILENAME = "test_pipeline.db.template"
+DB_FILENAME = "test_snapshot_pipeline.db.sqlite3"
+
+
+class HiveSnapshotTest(unittest.TestCase):
+    """Create fresh database file"""
+
+    def setUp(self):
+        copy2(here/DB_TEMPLATE_FILENAME, here/DB_FILENAME)
+        self.hive = HiveInstance(f"sqlite:///{here/DB_FILENAME}")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.hive.engine.dispose()
+        self.tmp_dir.cleanup()
+        os.remove(here/DB_FILENAME)
+
+    def test_export(self):
+        # small batches to go through several of them
+        with export_snapshot(self.hive, self.tmp_dir.name, batch_size=3) as snapshot:
+            self.assertEqual(20, snapshot.rows('job'))
+            self.assertEqual(list(range(1, 21)), list(snapshot.column('job', 'job_id')))
+            self.assertEqual(5, len(snapshot.analyses))
+            job = snapshot.get_job(11)
+            self.assertEqual('FAILED', job['status'])
+            self.assertEqual('TestRunnableParallel', job['logic_name'])
+            self.assertEqual(7, job['prev_job_id'])
+            self.assertEqual(4, job['retry_count'])
+            self.assertEqual(72, job['runtime_msec'])
+            self.assertEqual(-1, job['when_completed'], "Checking NULL times")
+            self.assertEqual(1500295909, snapshot.get_job(1)['when_completed'])
+            self.assertIsNone(snapshot.get_job(21))
+            self.assertEqual([8, 9, 10, 11], snapshot.get_children(7))
+            self.assertEqual([], snapshot.get_children(20))
+        self.assertRaises(ValueError, HiveSnapshot, os.path.join(self.tmp_dir.name, 'missing'))
+
+    def test_job_tree_status(self):
+        with self.hive.engine.begin() as connection:
+            # a pending semaphore, whose controlled jobs are still running
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1 WHERE semaphore_id = 2"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 2, status = 'RUN' "
+                                    "WHERE job_id = 5"))
+        with export_snapshot(self.hive, self.tmp_dir.name) as snapshot:
+            for job_id in range(1, 21):
+                self.assertEqual(self.hive.get_job_tree_status(self.hive.get_job_by_id(job_id)),
+                                 snapshot.get_job_tree_status(job_id), f"Checking job {job_id}")
+            self.assertEqual('incomplete', snapshot.get_job_tree_status(1))
+            self.assertEqual('incomplete', snapshot.get_job_tree_status(7))
+            self.assertRaises(ValueError, snapshot.get_job_tree_status, 21)
+
+    def test_job_tree_semaphore_below_unfinished_job(self):
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET status = 'RUN' WHERE job_id = 16"))
+            connection.execute(text("UPDATE job SET status = 'SEMAPHORED' WHERE job_id = 18"))
+            connection.execute(text("UPDATE semaphore SET local_jobs_counter = 1, dependent_job_id = 18 "
+                                    "WHERE semaphore_id = 2"))
+            connection.execute(text("UPDATE job SET controlled_semaphore_id = 2, status = 'FAILED' "
+                                    "WHERE job_id = 20"))
+        with export_snapshot(self.hive, self.tmp_dir.name) as snapshot:
+            self.assertEqual('failed', snapshot.get_job_tree_status(14))
+            for job_id in range(1, 21):
+                self.assertEqual(self.hive.get_job_tree_status(self.hive.get_job_by_id(job_id)),
+                                 snapshot.get_job_tree_status(job_id), f"Checking job {job_id}")
+
+    def test_progress(self):
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET param_id_stack = '7,8' WHERE job_id IN (9, 10, 11, 12)"))
+            connection.execute(text("UPDATE job SET param_id_stack = '17' WHERE job_id IN (13)"))
+        with export_snapshot(self.hive, self.tmp_dir.name) as snapshot:
+            for kwargs in ({}, {'analysis_id': 3}, {'by_analysis': True}):
+                self.assertEqual(self.hive.get_all_jobs_progress(7, **kwargs),
+                                 snapshot.get_all_jobs_progress(7, **kwargs))
+            self.assertEqual(0, snapshot.get_all_jobs_progress(17)['total'])
+
+    def test_analysis_summary(self):
+        with export_snapshot(self.hive, self.tmp_dir.name) as snapshot:
+            summary = snapshot.get_analysis_summary()
+        self.assertEqual({name: counts['statuses']
+                          for name, counts in self.hive.get_pipeline_summary().items()},
+                         {name: counts['statuses'] for name, counts in summary.items()})
+        self.assertEqual(4, summary['TestRunnableParallel']['retries'])
+        self.assertEqual(2277, summary['TestFactory']['runtime_msec'])
+        self.assertEqual(1462, summary['TestFactory']['max_runtime_msec'])
+
+    def test_failure_messages(self):
+        with self.hive.engine.begin() as connection:
+            connection.execute(text("UPDATE job SET status = 'FAILED' WHERE job_id = 10"))
+            messages = ((11, 'old'), (11, 'child failed'), (12, 'not failed'), (10, 'Ünïcode failure'))
+            for job_id, msg in messages:
+                connection.execute(text("INSERT INTO log_message (job_id, msg, message_class) "
+                                        "VALUES (:job_id, :msg, 'WORKER_ERROR')"),
+                                   {'job_id': job_id, 'msg': msg})
+        with export_snapshot(self.hive, self.tmp_dir.name) as snapshot:
+            self.assertEqual({10: 'Ünïcode failure', 11: 'child failed'}, snapshot.get_failure_messages())
+            self.assertEqual({10: 'Ünïcode failure', 11: 'child failed'},
+                             snapshot.get_failure_messages('TestRunnableParallel'))
+            self.assertEqual({}, snapshot.get_failure_messages('TestFactory'))
+            self.assertRaises(ValueError, snapshot.get_failure_messages, 'Unknown')
+            message_classes = snapshot.column('log_message', 'message_class')
+            self.assertEqual(['WORKER_ERROR'] * 4,
+                             [snapshot.message_classes[code] for code in message_classes])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,8 @@ import os
 import unittest
 from tempfile import mkstemp
 
+from sqlalchemy import event
+
 from ensembl.production.core.resource_lock import ResourceLocker, LockException
 
 logging.basicConfig()
@@ -31,10 +33,10 @@ def get_db():
     return dbfile
 
 
-def run_tst(test_function):
+def run_tst(test_function, **options):
     dbfile = get_db()
     try:
-        locker = ResourceLocker('sqlite:///' + str(dbfile))
+        locker = ResourceLocker('sqlite:///' + str(dbfile), **options)
         test_function(locker)
         return
     finally:
@@ -197,3 +199,99 @@ class UtilsTest(unittest.TestCase):
 
         run_tst(rwtest)
         return
+
+    def test_row_locking(self):
+        def rowtest(locker):
+            self.assertEqual('row', locker.locking)
+            lock1 = locker.lock(cname, ruri, rlock)
+            lock2 = locker.lock('otherclient', ruri, rlock)
+            with self.assertRaises(LockException):
+                locker.lock(cname, ruri, wlock)
+            # other resources are not affected
+            lock3 = locker.lock(cname, ruri + '2', wlock)
+            self.assertEqual(3, len(locker.get_locks()))
+            with self.assertRaises(ValueError):
+                locker.lock(cname, ruri, 'exclusive')
+            locker.unlock(lock1)
+            locker.unlock(lock2.resource_lock_id)
+            with self.assertRaises(ValueError):
+                locker.unlock(lock2.resource_lock_id)
+            lock4 = locker.lock(cname, ruri, wlock)
+            self.assertEqual(wlock, lock4.lock_type, "Lock type correct")
+            self.assertEqual(2, len(locker.get_clients()))
+            self.assertEqual(2, len(locker.get_resources()))
+            locker.unlock(lock3)
+            locker.delete_resource(ruri + '2')
+            self.assertEqual(1, len(locker.get_resources()))
+
+        run_tst(rowtest, locking='row')
+        with self.assertRaises(ValueError):
+            run_tst(rowtest, locking='none')
+        return
+
+    def test_lock_many(self):
+        ruri2 = ruri + '2'
+        ruri3 = ruri + '3'
+
+        def manytest(locker):
+            locks = locker.lock_many(cname, [(ruri2, wlock), (ruri, rlock)])
+            self.assertEqual([(ruri2, wlock), (ruri, rlock)], [(l.resource.uri, l.lock_type) for l in locks],
+                             "Locks in order of requests")
+            self.assertEqual(cname, locks[0].client.name, "Client correct")
+            # all or nothing: the lock on the free resource is not kept
+            with self.assertRaises(LockException) as context:
+                locker.lock_many('otherclient', [(ruri3, rlock), (ruri, wlock), (ruri2, rlock)])
+            self.assertIn("1 lock(s) found on " + ruri, str(context.exception))
+            self.assertIn("Write lock found on 1 - cannot lock for reading " + ruri2, str(context.exception))
+            self.assertEqual(0, len(locker.get_locks(resource_uri=ruri3)), "No partial lock")
+            self.assertEqual(2, len(locker.get_locks()))
+            with self.assertRaises(ValueError):
+                locker.lock_many(cname, [(ruri3, rlock), (ruri3, wlock)])
+            with self.assertRaises(ValueError):
+                locker.lock_many(cname, [(ruri3, rlock), (ruri, 'exclusive')])
+            locks.append(locker.lock_many('otherclient', [(ruri, rlock), (ruri3, wlock)])[1])
+            self.assertEqual(4, len(locker.get_locks()))
+            # unknown IDs release nothing
+            with self.assertRaises(ValueError):
+                locker.unlock_many([locks[0], 12345])
+            self.assertEqual(4, len(locker.get_locks()))
+            locker.unlock_many([locks[0], locks[1].resource_lock_id, locks[2]])
+            self.assertEqual([(ruri, rlock)], [(l.resource.uri, l.lock_type) for l in locker.get_locks()])
+            locker.unlock_many([])
+
+        for locking in ('table', 'row'):
+            run_tst(manytest, locking=locking)
+        return
+
+    def test_table_locks_on_one_connection(self):
+        def tabletest(locker):
+            # emulate MySQL table locks, recording the connection each step runs on
+            steps = []
+
+            def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+                if statement.startswith(('lock table', 'unlock tables')):
+                    steps.append((statement.split()[0], conn.connection.dbapi_connection))
+                    return 'SELECT 1', ()
+                return statement, parameters
+
+            event.listen(locker.engine, 'before_cursor_execute', before_cursor_execute, retval=True)
+            event.listen(locker.engine, 'commit',
+                         lambda conn: steps.append(('commit', conn.connection.dbapi_connection)))
+            locker.url = 'mysql://emulated'
+            lock = locker.lock(cname, ruri, wlock)
+            locker.unlock(lock)
+            locker.unlock_many([locker.lock(cname, ruri, rlock)])
+            locker.delete_resource(ruri)
+            locker.delete_client(cname)
+            locked = None
+            for step, connection in steps:
+                if step == 'lock':
+                    locked = connection
+                elif locked is not None:
+                    self.assertIs(locked, connection, "Commit and unlock on the locked connection")
+                    if step == 'unlock':
+                        locked = None
+            self.assertEqual(8, len([step for step, connection in steps if step == 'unlock']))
+
+        run_tst(tabletest)
+        return